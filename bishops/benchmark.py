@@ -0,0 +1,116 @@
+import argparse
+import random
+import sys
+
+from bishops import rules
+from puzzle_engine import (
+    benchmark,
+    traversal)
+
+
+def create_traversal(height, width, symmetric=False):
+    return traversal.Traversal(
+        rules.BishopsRules(height, width, symmetric=symmetric),
+        graph_directory=None)
+
+
+def build_graph(height, width):
+    puzzle_traversal = create_traversal(height, width)
+    graph, seconds = benchmark.time_call(puzzle_traversal.build_graph)
+    return {
+        'seconds': seconds,
+        'states': len(graph),
+        'edges': len(graph.neighbors),
+        'winning_states': len(graph.winning_nodes)}
+
+
+def build_map(height, width, symmetric):
+    puzzle_traversal = create_traversal(height, width, symmetric)
+    _, seconds = benchmark.time_call(puzzle_traversal.build_map)
+    return {
+        'seconds': seconds,
+        'states': len(puzzle_traversal.graph),
+        'edges': len(puzzle_traversal.graph.neighbors),
+        'winning_states': len(puzzle_traversal.graph.winning_nodes)}
+
+
+def get_sample_keys(graph, queries):
+    # The same positions from run to run, drawn from the state graph.
+    state_keys = list(graph.state_keys)
+    return random.Random(0).sample(state_keys, min(queries, len(state_keys)))
+
+
+def get_shortest_winning_path(height, width, symmetric, queries):
+    puzzle_traversal = create_traversal(height, width, symmetric)
+    puzzle_traversal.build_map()
+    state_keys = get_sample_keys(puzzle_traversal.graph, queries)
+
+    def follow_paths():
+        return sum(
+            len(list(puzzle_traversal.get_shortest_winning_path(state_key)))
+            for state_key in state_keys)
+
+    moves, seconds = benchmark.time_call(follow_paths)
+    return {
+        'seconds': seconds,
+        'states': len(state_keys),
+        'moves': moves}
+
+
+def find_moves(height, width, queries):
+    puzzle_traversal = create_traversal(height, width)
+    state_keys = get_sample_keys(puzzle_traversal.build_graph(), queries)
+    puzzle_rules = puzzle_traversal.rules
+
+    def find_all_moves():
+        return sum(
+            len(list(puzzle_rules.successors(state_key)))
+            for state_key in state_keys)
+
+    moves, seconds = benchmark.time_call(find_all_moves)
+    return {
+        'seconds': seconds,
+        'states': len(state_keys),
+        'moves': moves}
+
+
+def parse_layout(layout):
+    height, _, width = layout.partition('x')
+    return int(height), int(width)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the bishops solver.')
+    parser.add_argument(
+        '--layout',
+        action='append',
+        type=parse_layout,
+        default=None,
+        help='a board size as HEIGHTxWIDTH; may be repeated '
+             '(default: 4x5 and 4x6)')
+    benchmark.add_arguments(parser)
+    args = parser.parse_args(argv)
+    layouts = args.layout or [(4, 5), (4, 6)]
+    cases = []
+    for (height, width) in layouts:
+        suffix = '[{}x{}]'.format(height, width)
+        cases.extend([
+            ('build_graph' + suffix,
+             build_graph,
+             (height, width)),
+            ('build_map' + suffix,
+             build_map,
+             (height, width, args.symmetric)),
+            ('get_shortest_winning_path' + suffix,
+             get_shortest_winning_path,
+             (height, width, args.symmetric, args.queries)),
+            ('find_moves' + suffix,
+             find_moves,
+             (height, width, args.queries))])
+    benchmark.run('bishops', cases, args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,4 @@
-import threading
+import collections
 
 from game_common import (
     graph,
@@ -12,7 +12,12 @@ from zope.interface import (
 
 from bishops import (
     board,
+    rules,
     world_states)
+from puzzle_engine import (
+    instrumentation,
+    solver,
+    traversal)
 
 @implementer(interfaces.IWorld, interfaces.Observable)
 class BishopsWorld(object):
@@ -32,7 +37,21 @@ class BishopsWorld(object):
         self.max_top = self.height
         self.interactive = True
 
-        self.traversal = board.Traversal(world=self)
+        # The latest progress event of the map build, and whether the map
+        # is ready; both are set from the solver's thread.
+        self.map_progress = None
+        self.map_ready = False
+        self.traversal = traversal.Traversal(
+            rules.BishopsRules(
+                self.height_tiles,
+                self.width_tiles,
+                symmetric=True),
+            instrumentation=instrumentation.Instrumentation(
+                [instrumentation.ProgressSink(self.handle_map_progress)]))
+        self.solver = solver.SolverService(self.traversal, processes=True)
+        # (state key, future) of the last solution asked of the solver.
+        self.path_request = None
+        self.path = None
         self.canvasElements = set()
 
         self.current_time = 0
@@ -80,9 +99,7 @@ class BishopsWorld(object):
 
         self.canvas.render()
         self.state_machine.start()
-        self.compute_thread = threading.Thread(
-            target=self.traversal.build_map)
-        self.compute_thread.start()
+        self.solver.start()
         # self.traversal.discover_all_winning_states()
         # self.paths = self.traversal.get_all_winning_paths()
         # self.current_path = self.paths[0]
@@ -147,19 +164,37 @@ class BishopsWorld(object):
                 owner=self,
                 key=key)
 
+    def handle_map_progress(self, event):
+        if event['event'] == 'ready':
+            self.map_ready = True
+        else:
+            self.map_progress = event
+
     def initiate_auto_move(self):
-        current_state_string = board.BoardState(self.board).get_state_string()
-        current_state = self.traversal.discovered_states.get(
-            current_state_string
-        )
-        self.path = self.traversal.get_shortest_winning_path(
-            current_state
-        )
+        # Called every frame while waiting in auto mode; asks the solver
+        # once per position and starts animating when the answer is in.
+        state_key = board.BoardState(self.board).state_key
+        if self.path_request is None or self.path_request[0] != state_key:
+            if self.path_request is not None:
+                # Stops a search for a position that has since changed, so
+                # that it does not hold up the new one.
+                self.path_request[1].cancel()
+            self.path_request = (
+                state_key,
+                self.solver.request_moves(self.board))
+        future = self.path_request[1]
+        if not future.done():
+            return
+        moves = future.result()
+        if not moves:
+            # Solved already, or no way to win from here.
+            self.interactive = True
+            return
+        self.path = collections.deque(moves)
         self.selected_piece = None
         self.selected_move = None
         self.piece_to_move = None
         self.state_machine.change_state(world_states.AutoAnimate)
-        
 
     def update(self,
                current_time):
@@ -229,6 +264,37 @@ class BishopsWorld(object):
             GL.glVertex2f(self.width - self.border, y)
 
         GL.glEnd()
+        if not self.map_ready:
+            self.render_map_progress()
+
+    def render_map_progress(self):
+        # A band along the bottom of the board, until the map is ready.
+        progress = self.map_progress
+        if self.solver.has_failed():
+            text = 'Could not build the solution map'
+        elif progress is None:
+            text = 'Building the solution map'
+        else:
+            text = 'Building the solution map: depth {}, {} states'.format(
+                progress['depth'],
+                progress['states'])
+            if progress['eta_seconds'] is not None:
+                text += ', {:.0f}s+ to go'.format(progress['eta_seconds'])
+        if not self.interactive:
+            text += ' (auto-move searches meanwhile)'
+        GL.glColor3f(0, 0, 0)
+        GL.glBegin(GL.GL_QUADS)
+        GL.glVertex2f(self.border, self.border)
+        GL.glVertex2f(self.width - self.border, self.border)
+        GL.glVertex2f(self.width - self.border, self.border + 24)
+        GL.glVertex2f(self.border, self.border + 24)
+        GL.glEnd()
+        GL.glColor3f(1, 1, 1)
+        GL.glRasterPos2f(self.border + 6, self.border + 8)
+        for character in text:
+            GLUT.glutBitmapCharacter(
+                GLUT.GLUT_BITMAP_HELVETICA_12,
+                ord(character))
 
     
     def getAllCanvasElements(self):
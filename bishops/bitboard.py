@@ -0,0 +1,259 @@
+import functools
+
+# Bishops slide along the four diagonals.  The order matches the order in
+# which moves have always been generated, so that move lists stay stable.
+DIAGONAL_OFFSETS = (
+    (-1, -1),
+    (-1, 1),
+    (1, -1),
+    (1, 1))
+
+# The puzzle is unchanged by flipping the rows, and by swapping the colours
+# while mirroring the columns.  Transforms are bit flags; every element of
+# the group is its own inverse and composing two is XOR.
+IDENTITY = 0
+FLIP_ROWS = 1
+SWAP_AND_MIRROR = 2
+TRANSFORMS = (
+    IDENTITY,
+    FLIP_ROWS,
+    SWAP_AND_MIRROR,
+    FLIP_ROWS | SWAP_AND_MIRROR)
+
+
+@functools.lru_cache(maxsize=None)
+def get_layout(height, width):
+    return Layout(height, width)
+
+
+class Layout:
+    def __init__(self, height, width):
+        self.height = height
+        self.width = width
+        self.size = height * width
+        self.full_mask = (1 << self.size) - 1
+        self.powers = [3 ** square for square in range(self.size)]
+        self.first_column = 0
+        self.last_column = 0
+        for row in range(height):
+            self.first_column |= self.bit(row, 0)
+            self.last_column |= self.bit(row, width - 1)
+
+        # rays[square][i] is the diagonal leaving square along
+        # DIAGONAL_OFFSETS[i], excluding the square itself.
+        self.rays = []
+        # diagonals[square] is every square on either diagonal through it.
+        self.diagonals = []
+        for square in range(self.size):
+            row, column = self.cell(square)
+            rays_for_square = []
+            diagonal_mask = 1 << square
+            for (row_offset, column_offset) in DIAGONAL_OFFSETS:
+                ray_mask = 0
+                scan_row = row + row_offset
+                scan_column = column + column_offset
+                while self.in_bounds(scan_row, scan_column):
+                    ray_mask |= self.bit(scan_row, scan_column)
+                    scan_row += row_offset
+                    scan_column += column_offset
+                rays_for_square.append(ray_mask)
+                diagonal_mask |= ray_mask
+            self.rays.append(rays_for_square)
+            self.diagonals.append(diagonal_mask)
+
+        # transformed_squares[transform][square]
+        self.transformed_squares = []
+        for transform in TRANSFORMS:
+            self.transformed_squares.append([
+                self.square(*self.transform_cell(self.cell(square), transform))
+                for square in range(self.size)])
+
+        self.white_target_moves = self.get_moves_to_mask(self.first_column)
+        self.red_target_moves = self.get_moves_to_mask(self.last_column)
+
+    def get_moves_to_mask(self, target_mask):
+        # Fewest bishop moves from each square to any square of target_mask
+        # on an empty board.
+        moves = [None] * self.size
+        frontier = []
+        for square in range(self.size):
+            if target_mask & (1 << square):
+                moves[square] = 0
+                frontier.append(square)
+        depth = 0
+        while frontier:
+            depth += 1
+            next_frontier = []
+            for square in frontier:
+                reachable = self.diagonals[square]
+                for next_square in range(self.size):
+                    if (reachable & (1 << next_square) and
+                            moves[next_square] is None):
+                        moves[next_square] = depth
+                        next_frontier.append(next_square)
+            frontier = next_frontier
+        return moves
+
+    def estimate_moves(self, white, red):
+        # Each move shifts one bishop, so the per-bishop distances to their
+        # target columns add up to a lower bound.
+        moves = 0
+        for (pieces, target_moves) in (
+                (white, self.white_target_moves),
+                (red, self.red_target_moves)):
+            while pieces:
+                low_bit = pieces & -pieces
+                moves += target_moves[low_bit.bit_length() - 1]
+                pieces ^= low_bit
+        return moves
+
+    def in_bounds(self, row, column):
+        return 0 <= row < self.height and 0 <= column < self.width
+
+    def square(self, row, column):
+        return row * self.width + column
+
+    def bit(self, row, column):
+        return 1 << self.square(row, column)
+
+    def cell(self, square):
+        return divmod(square, self.width)
+
+    def attacks(self, pieces, occupied):
+        # Checks see through other pieces; only empty squares are marked.
+        attacked = 0
+        while pieces:
+            low_bit = pieces & -pieces
+            attacked |= self.diagonals[low_bit.bit_length() - 1]
+            pieces ^= low_bit
+        return attacked & ~occupied
+
+    def find_moves(self, square, occupied, checks):
+        # Yields (row_offset, column_offset, to_square), nearest square first
+        # along each diagonal.  A piece ends the diagonal; checked squares
+        # may be passed over but not landed on.
+        rays = self.rays[square]
+        for direction_index in range(len(DIAGONAL_OFFSETS)):
+            row_offset, column_offset = DIAGONAL_OFFSETS[direction_index]
+            ray_mask = rays[direction_index]
+            blockers = ray_mask & occupied
+            if blockers:
+                if row_offset > 0:
+                    blocker = (blockers & -blockers).bit_length() - 1
+                else:
+                    blocker = blockers.bit_length() - 1
+                ray_mask &= ~self.rays[blocker][direction_index]
+                ray_mask &= ~(1 << blocker)
+            targets = ray_mask & ~checks
+            while targets:
+                if row_offset > 0:
+                    target_bit = targets & -targets
+                else:
+                    target_bit = 1 << (targets.bit_length() - 1)
+                targets ^= target_bit
+                yield (row_offset, column_offset, target_bit.bit_length() - 1)
+
+    def successors(self, white, red):
+        # Yields (piece_type, from_square, to_square, row_offset,
+        # column_offset, child_white, child_red) for every legal move.
+        occupied = white | red
+        white_checks = self.attacks(red, occupied)
+        red_checks = self.attacks(white, occupied)
+        for (piece_type, pieces, checks) in (
+                ('white', white, white_checks),
+                ('red', red, red_checks)):
+            while pieces:
+                low_bit = pieces & -pieces
+                pieces ^= low_bit
+                from_square = low_bit.bit_length() - 1
+                for (row_offset, column_offset, to_square) in self.find_moves(
+                        from_square,
+                        occupied,
+                        checks):
+                    yield (
+                        (piece_type, from_square, to_square, row_offset,
+                         column_offset) +
+                        self.move_piece(
+                            white,
+                            red,
+                            piece_type,
+                            from_square,
+                            to_square))
+
+    def move_piece(self, white, red, piece_type, from_square, to_square):
+        moved = (1 << from_square) | (1 << to_square)
+        if piece_type == 'white':
+            return white ^ moved, red
+        return white, red ^ moved
+
+    def transform_cell(self, cell, transform):
+        row, column = cell
+        if transform & FLIP_ROWS:
+            row = self.height - 1 - row
+        if transform & SWAP_AND_MIRROR:
+            column = self.width - 1 - column
+        return (row, column)
+
+    def transform_mask(self, mask, transform):
+        squares = self.transformed_squares[transform]
+        transformed = 0
+        while mask:
+            low_bit = mask & -mask
+            transformed |= 1 << squares[low_bit.bit_length() - 1]
+            mask ^= low_bit
+        return transformed
+
+    def transform(self, white, red, transform):
+        white = self.transform_mask(white, transform)
+        red = self.transform_mask(red, transform)
+        if transform & SWAP_AND_MIRROR:
+            return red, white
+        return white, red
+
+    def canonicalize(self, white, red):
+        # Returns (state_key, transform) for the smallest key in the orbit,
+        # where transform maps the given state onto it.
+        best_key = None
+        best_transform = IDENTITY
+        for transform in TRANSFORMS:
+            state_key = self.encode(*self.transform(white, red, transform))
+            if best_key is None or state_key < best_key:
+                best_key = state_key
+                best_transform = transform
+        return best_key, best_transform
+
+    def is_winning(self, white, red):
+        return white == self.first_column and red == self.last_column
+
+    def encode(self, white, red):
+        # One base-3 digit per square: 0 empty, 1 white, 2 red.
+        state_key = 0
+        for (pieces, digit) in ((white, 1), (red, 2)):
+            while pieces:
+                low_bit = pieces & -pieces
+                state_key += digit * self.powers[low_bit.bit_length() - 1]
+                pieces ^= low_bit
+        return state_key
+
+    def decode(self, state_key):
+        white = 0
+        red = 0
+        for square in range(self.size):
+            state_key, digit = divmod(state_key, 3)
+            if digit == 1:
+                white |= 1 << square
+            elif digit == 2:
+                red |= 1 << square
+        return white, red
+
+    def to_string(self, white, red):
+        symbols = []
+        for square in range(self.size):
+            bit = 1 << square
+            if white & bit:
+                symbols.append('W')
+            elif red & bit:
+                symbols.append('R')
+            else:
+                symbols.append(' ')
+        return ''.join(symbols)
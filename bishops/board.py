@@ -1,7 +1,4 @@
-import collections
-import copy
 import math
-import time
 
 from game_common import (
     interfaces)
@@ -11,12 +8,9 @@ from game_common.twodee.geometry import (
 from OpenGL import (GL, GLUT)
 import zope.interface
 
-Move = collections.namedtuple(
-    'Move',
-    ['piece_type',
-     'piece_from',
-     'piece_to',
-     'direction'])
+from bishops import (
+    bitboard,
+    rules)
 
 class Board:
     def __init__(self, pieces_by_type, world):
@@ -24,6 +18,9 @@ class Board:
         self.pieces = []
         self.moves_by_piece = None
         self.world = world
+        self.layout = bitboard.get_layout(
+            world.height_tiles,
+            world.width_tiles)
         for piece_type, pieces_for_type in pieces_by_type.items():
             for piece in pieces_for_type:
                 piece.set_board(self)
@@ -47,18 +44,15 @@ class Board:
         
     @classmethod
     def from_initial_state(cls, world):
+        last_column = world.width_tiles - 1
         white_bishops = [
-            create_white_bishop(0, 4),
-            create_white_bishop(1, 4),
-            create_white_bishop(2, 4),
-            create_white_bishop(3, 4)
+            create_white_bishop(row, last_column)
+            for row in range(world.height_tiles)
         ]
 
         red_bishops = [
-            create_red_bishop(0, 0),
-            create_red_bishop(1, 0),
-            create_red_bishop(2, 0),
-            create_red_bishop(3, 0)
+            create_red_bishop(row, 0)
+            for row in range(world.height_tiles)
         ]
 
         pieces_by_type = {
@@ -145,42 +139,24 @@ class BoardPiece:
         self.board.finish_move()
 
     def find_moves(self, current_state):
-        if self.piece_type == 'white':
-            checks = current_state.white_checks
-        elif self.piece_type == 'red':
-            checks = current_state.red_checks
-        else:
-            raise NotImplementedError()
-
+        checks = current_state.get_checks_for_piece(self)
+        layout = current_state.layout
         moves = []
-        for row_offset in (-1, 1):
-            for column_offset in (-1, 1):
-                current_row = self.row + row_offset
-                current_column = self.column + column_offset
-                while (current_row >= 0 and 
-                       current_row < self.board.world.height_tiles and
-                       current_column >= 0 and 
-                       current_column < self.board.world.width_tiles):
-                    space = checks[current_row][current_column]
-                    if space == ' ':
-                        moves.append(
-                            Move(
-                                piece_type=self.piece_type,
-                                piece_from=(self.row, self.column),
-                                piece_to=(current_row, current_column),
-                                direction=Direction.get_by_offsets(
-                                    row_offset,
-                                    column_offset
-                                )
-                            )
-                        )
-                    elif space != 'C':
-                        # If another piece is in this space, the rest
-                        # of the diagonal is blocked for this piece.
-                        break
-
-                    current_row += row_offset
-                    current_column += column_offset
+        for (row_offset, column_offset, to_square) in layout.find_moves(
+                layout.square(self.row, self.column),
+                current_state.occupied,
+                checks):
+            moves.append(
+                rules.Move(
+                    piece_type=self.piece_type,
+                    piece_from=(self.row, self.column),
+                    piece_to=layout.cell(to_square),
+                    direction=Direction.get_by_offsets(
+                        row_offset,
+                        column_offset
+                    )
+                )
+            )
 
         return moves
 
@@ -316,44 +292,33 @@ def create_red_bishop(row, column):
 
 
 class BoardState:
-    def __init__(self, board, move=0):
-        self.initialize_rows()
+    def __init__(self, board):
+        self.layout = board.layout
         self.pieces_by_type = {
             'white': [],
             'red': []
         }
+        self.masks_by_type = {
+            'white': 0,
+            'red': 0
+        }
         self.board = board
         self.plot_pieces(board)
+        self.occupied = self.masks_by_type['white'] | self.masks_by_type['red']
+        # Squares on any diagonal through each colour's pieces.
+        self.attacks_by_type = {}
+        for piece_type, mask in self.masks_by_type.items():
+            self.attacks_by_type[piece_type] = self.layout.attacks(mask, 0)
         self.white_checks = self.fill_checks('red')
         self.red_checks = self.fill_checks('white')
-        self.state_string = self.get_state_string()
-        self.adjacent_states = {}
-        self.move = move
-        self.moves_from_winning_states = []
+        self.state_key = self.layout.encode(
+            self.masks_by_type['white'],
+            self.masks_by_type['red'])
 
     def fill_checks(self, piece_type):
-        if piece_type == 'red':
-            symbol = 'R'
-        elif piece_type == 'white':
-            symbol = 'W'
-        else:
+        if piece_type not in self.attacks_by_type:
             raise NotImplementedError()
-        checks = copy.deepcopy(self.rows)
-        board_height = len(self.rows)
-        board_width = len(self.rows[0])
-        for (piece_row, piece_column) in self.pieces_by_type[piece_type]:
-            for row_offset in (-1, 1):
-                for column_offset in (-1, 1):
-                    scan_row = piece_row
-                    scan_column = piece_column
-                    while (scan_row >= 0 and scan_row < board_height and
-                           scan_column >= 0 and scan_column < board_width):
-                        if self.rows[scan_row][scan_column] == ' ':
-                            checks[scan_row][scan_column] = 'C'
-                        scan_row += row_offset
-                        scan_column += column_offset
-
-        return checks
+        return self.attacks_by_type[piece_type] & ~self.occupied
 
     def get_checks_for_piece(self, piece):
         if piece.piece_type == 'red':
@@ -364,24 +329,23 @@ class BoardState:
             raise NotImplementedError()
 
     def is_winning(self):
-        return self.rows == [
-            ['W', ' ', ' ', ' ', 'R'],
-            ['W', ' ', ' ', ' ', 'R'],
-            ['W', ' ', ' ', ' ', 'R'],
-            ['W', ' ', ' ', ' ', 'R'],
+        return self.layout.is_winning(
+            self.masks_by_type['white'],
+            self.masks_by_type['red'])
+
+    @property
+    def state_string(self):
+        return self.get_state_string()
+
+    @property
+    def rows(self):
+        state_string = self.get_state_string()
+        width = self.layout.width
+        return [
+            list(state_string[row_start:row_start + width])
+            for row_start in range(0, len(state_string), width)
         ]
 
-    def initialize_rows(self):
-        self.rows = [
-            self._create_row(),
-            self._create_row(),
-            self._create_row(),
-            self._create_row()
-        ]
-        
-    def _create_row(self):
-        return [' ', ' ', ' ', ' ', ' ']
-
     def plot_pieces(self, board):
         for piece_type, pieces in board.pieces_by_type.items():
             for piece in pieces:
@@ -390,224 +354,22 @@ class BoardState:
                 )
                 for column_offset in range(piece.width):
                     for row_offset in range(piece.height):
-                        new_row = piece.row + row_offset
-                        new_column = piece.column + column_offset
-                        self.rows[new_row][new_column] = piece.symbol
+                        self.masks_by_type[piece_type] |= self.layout.bit(
+                            piece.row + row_offset,
+                            piece.column + column_offset)
 
     def print_self(self):
         for row in self.rows:
             print(''.join(row))
 
     def get_state_string(self):
-        return ''.join([''.join(x) for x in self.rows])
-
-    def connect(self, other_state, move_info):
-        forward = move_info
-        backward = reverse_move_info(forward)
-        self.adjacent_states[other_state.state_string] = (other_state, forward)
-        other_state.adjacent_states[self.state_string] = (self, backward)
+        return self.layout.to_string(
+            self.masks_by_type['white'],
+            self.masks_by_type['red'])
 
 
-def reverse_move_info(move):
-    backward = Move(
-        piece_type=move.piece_type,
-        piece_from=move.piece_to,
-        piece_to=move.piece_from,
-        direction=Direction.opposite(move.direction))
-    return backward
-
-        
-class Traversal:
-    def __init__(self, world):
-        board = Board.from_initial_state(world=world)
-        self.board = board
-        self.next_board = board.copy()
-        self.starting_state = BoardState(board=board)
-        self.discovered_states = {
-            self.starting_state.state_string: self.starting_state
-        }
-        self.current_state = None
-
-
-    def get_shortest_winning_path(self, current_state):
-        path_index = 0
-        current_min = current_state.moves_from_winning_states[0]
-        for i in range(len(current_state.moves_from_winning_states[1:])):
-            moves = current_state.moves_from_winning_states[i]
-            if moves < current_min:
-                path_index = i
-                current_min = moves
-
-        moves = current_min
-
-        while moves > 0:
-            adjacent_states = current_state.adjacent_states
-            for (adjacent_state, move) in adjacent_states.values():
-                if adjacent_state.moves_from_winning_states[path_index] < moves:
-                    current_state = adjacent_state
-                    yield (current_state, move)
-                    moves = current_state.moves_from_winning_states[path_index]
-                    break
-
-
-    def get_all_winning_paths(self, starting_state=None):
-        if starting_state is None:
-            starting_state = self.starting_state
-        paths = []
-        for winning_state in self.winning_states:
-            current_state = winning_state
-            path = [(current_state, None)]
-            while current_state != starting_state:
-                next_state = None
-                backward_move = None
-                adjacent_states = current_state.adjacent_states
-                for (adjacent_state, backward) in adjacent_states.values():
-                    if adjacent_state.move == current_state.move - 1:
-                        next_state = adjacent_state
-                        backward_move = backward
-                        break
-                if next_state is None:
-                    raise Exception('Cannot build path back from {}'.format(
-                        current_state))
-                else:
-                    current_state = next_state
-                    path.insert(
-                        0,
-                        (current_state,
-                         reverse_move_info(backward_move)))
-            paths.append(path)
-        return paths
-
-    def build_map(self):
-        print('Discovering winning states')
-        winning_states = self.discover_all_winning_states()
-        print('Winning states disccovered')
-        path_index = 0
-        for winning_state in winning_states:
-            print('Mapping path {}'.format(path_index))
-            moves = 0
-            state_queue = [winning_state]
-            mapped_states = {winning_state}
-            winning_state.moves_from_winning_states.append(0)
-            while state_queue:
-                current_state = state_queue.pop(0)
-                move_number =\
-                    current_state.moves_from_winning_states[path_index] + 1
-                adjacent_states = current_state.adjacent_states
-                for (adjacent_state, _) in adjacent_states.values():
-                    if adjacent_state in mapped_states:
-                        continue
-                    mapped_states.add(adjacent_state)
-                    adjacent_state.moves_from_winning_states.append(move_number)
-                    state_queue.append(adjacent_state)
-            print('Finished map for path {}'.format(path_index))
-            path_index += 1
-
-    def discover_all_winning_states(self):
-        count = 0
-        winning_states = []
-        state_queue = [self.starting_state]
-        while state_queue:
-            count += 1
-            self.current_state = state_queue.pop(0)
-            self.board.update_pieces_from_state(self.current_state)
-            self.next_board.update_pieces_from_board(self.board)
-            if self.current_state.is_winning():
-                winning_states.append(self.current_state)
-                # Only need 1, not all
-                return winning_states
-                #continue
-
-            moves_by_piece = self.next_board.find_moves(self.current_state)
-            for (piece, moves_for_piece) in moves_by_piece.items():
-                for move in moves_for_piece:
-                    piece.row, piece.column = move.piece_to
-                    board_state_candidate =\
-                        BoardState(
-                            board=self.next_board,
-                            move=self.current_state.move + 1
-                        )
-                    existing_board_state =\
-                        self.discovered_states.get(
-                            board_state_candidate.state_string
-                        )
-                    if existing_board_state:
-                        board_state = existing_board_state
-                    else:
-                        board_state = board_state_candidate
-                        self.discovered_states[board_state.state_string] =\
-                            board_state
-                        state_queue.append(board_state)
-
-                    self.current_state.connect(
-                        board_state,
-                        move
-                    )
-                    self.next_board.update_pieces_from_board(self.board)
-            time.sleep(.00001)
-        self.winning_states = winning_states
-        return winning_states
-
-
-    def print_board(self):
-        self.current_state.print_self()
-
-def get_direction(row_offset, column_offset):
-    if row_offset == 0 and column_offset == 1:
-        return Direction.UP
-    elif row_offset == 1 and column_offset == 0:
-        return Direction.RIGHT
-    elif row_offset == 0 and column_offset == -1:
-        return Direction.DOWN
-    elif row_offset == -1 and column_offset == 0:
-        return Direction.LEFT
-    elif row_offset == 1 and column_offset == 1:
-        return Direction.UP_RIGHT
-    elif row_offset == -1 and column_offset == 1:
-        return Direction.UP_LEFT
-    elif row_offset == 1 and column_offset == -1:
-        return Direction.DOWN_RIGHT
-    elif row_offset == -1 and column_offset == -1:
-        return Direction.DOWN_LEFT
-    else:
-        raise NotImplementedError()
-
-class Direction:
-    UP = 0
-    RIGHT = 1
-    DOWN = 2
-    LEFT = 3
-    UP_RIGHT = 4
-    UP_LEFT = 5
-    DOWN_RIGHT = 6
-    DOWN_LEFT = 7
-
-    direction_by_offsets = {
-        (0, 1): UP,
-        (1, 0): RIGHT,
-        (0, -1): DOWN,
-        (-1, 0): LEFT,
-        (1, 1): UP_RIGHT,
-        (-1, 1): UP_LEFT,
-        (1, -1): DOWN_RIGHT,
-        (-1, -1): DOWN_LEFT
-    }
-
-    offsets_by_direction = {}
-
-    for (k, v) in direction_by_offsets.items():
-        offsets_by_direction[v] = k
-
-    reverse_moves = {
-        UP: DOWN,
-        RIGHT: LEFT,
-        UP_RIGHT: DOWN_LEFT,
-        UP_LEFT: DOWN_RIGHT
-    }
-
-    for (k, v) in reverse_moves.copy().items():
-        reverse_moves[v] = k
-
+class Direction(rules.Direction):
+    # The arrow keys that pick a direction in the UI.
     keys = (
         GLUT.GLUT_KEY_UP,
         GLUT.GLUT_KEY_RIGHT,
@@ -621,16 +383,3 @@ class Direction:
     for i in range(4):
         direction_by_key[keys[i]] = i
         key_by_direction[i] = keys[i]
-
-    @classmethod
-    def opposite(cls, direction):
-        return cls.reverse_moves[direction]
-
-    @classmethod
-    def get_by_offsets(cls, row_offset, column_offset):
-        return cls.direction_by_offsets[(row_offset, column_offset)]
-
-    @classmethod
-    def get_offsets(cls, direction):
-        return cls.offsets_by_direction[direction]
-
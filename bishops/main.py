@@ -1,9 +1,9 @@
-from game_common import canvas
-
-import bishops_world
-
-
 def main():
+    # Imported here rather than at the top so that nothing but the GUI
+    # pulls in OpenGL; bishops.solve runs the solver headless.
+    from game_common import canvas
+    import bishops_world
+
     world = bishops_world.BishopsWorld()
     bishops_canvas = canvas.Canvas(
             world=world,
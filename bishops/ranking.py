@@ -0,0 +1,76 @@
+import math
+
+# Combinadic (colexicographic) ranking of bishop placements.  A placement
+# of white_count white bishops and red_count red bishops on size squares
+# maps to a dense integer in [0, C(size, white_count) *
+# C(size - white_count, red_count)), so tables over every placement can be
+# flat arrays instead of dicts.
+
+
+def rank_combination(mask):
+    rank = 0
+    index = 1
+    while mask:
+        low_bit = mask & -mask
+        rank += math.comb(low_bit.bit_length() - 1, index)
+        mask ^= low_bit
+        index += 1
+    return rank
+
+
+def unrank_combination(rank, count):
+    mask = 0
+    for index in range(count, 0, -1):
+        position = index - 1
+        while math.comb(position + 1, index) <= rank:
+            position += 1
+        rank -= math.comb(position, index)
+        mask |= 1 << position
+    return mask
+
+
+def compress(mask, removed):
+    # Renumbers the squares of mask as if the squares in removed did not
+    # exist.
+    compressed = 0
+    while mask:
+        low_bit = mask & -mask
+        square = low_bit.bit_length() - 1
+        compressed |= 1 << (square - bin(removed & (low_bit - 1)).count('1'))
+        mask ^= low_bit
+    return compressed
+
+
+def expand(mask, removed):
+    expanded = 0
+    square = 0
+    index = 0
+    while mask:
+        if not removed & (1 << square):
+            if mask & (1 << index):
+                expanded |= 1 << square
+                mask ^= 1 << index
+            index += 1
+        square += 1
+    return expanded
+
+
+class PlacementRanking:
+    def __init__(self, size, white_count, red_count):
+        self.size = size
+        self.white_count = white_count
+        self.red_count = red_count
+        self.white_placements = math.comb(size, white_count)
+        self.red_placements = math.comb(size - white_count, red_count)
+        self.count = self.white_placements * self.red_placements
+
+    def rank(self, white, red):
+        return (
+            rank_combination(white) * self.red_placements +
+            rank_combination(compress(red, white)))
+
+    def unrank(self, rank):
+        white_rank, red_rank = divmod(rank, self.red_placements)
+        white = unrank_combination(white_rank, self.white_count)
+        red = expand(unrank_combination(red_rank, self.red_count), white)
+        return white, red
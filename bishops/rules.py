@@ -0,0 +1,254 @@
+import collections
+
+from bishops import (
+    bitboard,
+    ranking)
+from puzzle_engine import rules
+
+Move = collections.namedtuple(
+    'Move',
+    ['piece_type',
+     'piece_from',
+     'piece_to',
+     'direction'])
+
+PIECE_TYPES = ('white', 'red')
+RULES_VERSION = 1
+
+
+def pack_move(layout, piece_type, from_square, to_square):
+    return (
+        (PIECE_TYPES.index(piece_type) * layout.size + from_square) *
+        layout.size + to_square)
+
+
+def unpack_move(layout, move_code):
+    type_index, squares = divmod(move_code, layout.size * layout.size)
+    from_square, to_square = divmod(squares, layout.size)
+    piece_from = layout.cell(from_square)
+    piece_to = layout.cell(to_square)
+    return Move(
+        piece_type=PIECE_TYPES[type_index],
+        piece_from=piece_from,
+        piece_to=piece_to,
+        direction=get_diagonal_direction(piece_from, piece_to))
+
+
+def transform_move(layout, move, transform):
+    # Maps a move through one of the board symmetries in bitboard.
+    if transform == bitboard.IDENTITY:
+        return move
+    piece_type = move.piece_type
+    if transform & bitboard.SWAP_AND_MIRROR:
+        piece_type = PIECE_TYPES[1 - PIECE_TYPES.index(piece_type)]
+    piece_from = layout.transform_cell(move.piece_from, transform)
+    piece_to = layout.transform_cell(move.piece_to, transform)
+    return Move(
+        piece_type=piece_type,
+        piece_from=piece_from,
+        piece_to=piece_to,
+        direction=get_diagonal_direction(piece_from, piece_to))
+
+
+def get_diagonal_direction(piece_from, piece_to):
+    row_offset = 1 if piece_to[0] > piece_from[0] else -1
+    column_offset = 1 if piece_to[1] > piece_from[1] else -1
+    return Direction.get_by_offsets(row_offset, column_offset)
+
+
+def reverse_move_info(move):
+    backward = Move(
+        piece_type=move.piece_type,
+        piece_from=move.piece_to,
+        piece_to=move.piece_from,
+        direction=Direction.opposite(move.direction))
+    return backward
+
+
+class PlacementCodec(rules.StateCodec):
+    # Ranks a placement by the combinadic ranking of its bitboards.
+    def __init__(self, layout, white_count, red_count):
+        self.layout = layout
+        self.ranking = ranking.PlacementRanking(
+            layout.size,
+            white_count,
+            red_count)
+        self.count = self.ranking.count
+
+    def rank(self, state_key):
+        return self.ranking.rank(*self.layout.decode(state_key))
+
+    def unrank(self, rank):
+        return self.layout.encode(*self.ranking.unrank(rank))
+
+
+class BishopsRules(rules.Rules):
+    name = 'bishops'
+    version = RULES_VERSION
+
+    def __init__(self, height, width, symmetric=False):
+        self.layout = bitboard.get_layout(height, width)
+        # With symmetric set, the state graph holds one canonical state per
+        # orbit of the board symmetries, and paths are mapped back onto the
+        # actual position when they are walked.
+        self.symmetric = symmetric
+        # One bishop of each colour per row.
+        self.codec = PlacementCodec(self.layout, height, height)
+
+    def get_identity(self):
+        return (self.layout.height, self.layout.width)
+
+    def encode(self, board):
+        layout = self.layout
+        masks = {piece_type: 0 for piece_type in PIECE_TYPES}
+        for piece in board.pieces:
+            masks[piece.piece_type] |= layout.bit(piece.row, piece.column)
+        return layout.encode(masks['white'], masks['red'])
+
+    def get_start_key(self):
+        # Whites start down the last column, reds down the first.
+        return self.layout.encode(
+            self.layout.last_column,
+            self.layout.first_column)
+
+    def successors(self, state_key):
+        layout = self.layout
+        white, red = layout.decode(state_key)
+        for (piece_type, from_square, to_square, row_offset, column_offset,
+             child_white, child_red) in layout.successors(white, red):
+            yield (
+                layout.encode(child_white, child_red),
+                Move(
+                    piece_type=piece_type,
+                    piece_from=layout.cell(from_square),
+                    piece_to=layout.cell(to_square),
+                    direction=Direction.get_by_offsets(
+                        row_offset,
+                        column_offset)))
+
+    def expand(self, state_key):
+        # Packs moves straight from the squares instead of building Moves.
+        layout = self.layout
+        white, red = layout.decode(state_key)
+        successors = []
+        for (piece_type, from_square, to_square, _, _,
+             child_white, child_red) in layout.successors(white, red):
+            if self.symmetric:
+                child_key, _ = layout.canonicalize(child_white, child_red)
+            else:
+                child_key = layout.encode(child_white, child_red)
+            successors.append((
+                child_key,
+                pack_move(layout, piece_type, from_square, to_square)))
+        return successors
+
+    def is_goal(self, state_key):
+        return self.layout.is_winning(*self.layout.decode(state_key))
+
+    def get_goal_keys(self):
+        return [self.layout.encode(
+            self.layout.first_column,
+            self.layout.last_column)]
+
+    def reverse_move(self, move):
+        return reverse_move_info(move)
+
+    def apply_move(self, state_key, move):
+        layout = self.layout
+        digit = PIECE_TYPES.index(move.piece_type) + 1
+        return state_key + digit * (
+            layout.powers[layout.square(*move.piece_to)] -
+            layout.powers[layout.square(*move.piece_from)])
+
+    def pack_move(self, move):
+        return pack_move(
+            self.layout,
+            move.piece_type,
+            self.layout.square(*move.piece_from),
+            self.layout.square(*move.piece_to))
+
+    def unpack_move(self, move_code):
+        return unpack_move(self.layout, move_code)
+
+    def estimate_moves(self, state_key):
+        return self.layout.estimate_moves(*self.layout.decode(state_key))
+
+    def canonicalize(self, state_key):
+        if self.symmetric:
+            return self.layout.canonicalize(*self.layout.decode(state_key))
+        return state_key, bitboard.IDENTITY
+
+    def transform_move(self, move, transform):
+        return transform_move(self.layout, move, transform)
+
+    def get_codec(self):
+        return self.codec
+
+
+def get_direction(row_offset, column_offset):
+    if row_offset == 0 and column_offset == 1:
+        return Direction.UP
+    elif row_offset == 1 and column_offset == 0:
+        return Direction.RIGHT
+    elif row_offset == 0 and column_offset == -1:
+        return Direction.DOWN
+    elif row_offset == -1 and column_offset == 0:
+        return Direction.LEFT
+    elif row_offset == 1 and column_offset == 1:
+        return Direction.UP_RIGHT
+    elif row_offset == -1 and column_offset == 1:
+        return Direction.UP_LEFT
+    elif row_offset == 1 and column_offset == -1:
+        return Direction.DOWN_RIGHT
+    elif row_offset == -1 and column_offset == -1:
+        return Direction.DOWN_LEFT
+    else:
+        raise NotImplementedError()
+
+class Direction:
+    UP = 0
+    RIGHT = 1
+    DOWN = 2
+    LEFT = 3
+    UP_RIGHT = 4
+    UP_LEFT = 5
+    DOWN_RIGHT = 6
+    DOWN_LEFT = 7
+
+    direction_by_offsets = {
+        (0, 1): UP,
+        (1, 0): RIGHT,
+        (0, -1): DOWN,
+        (-1, 0): LEFT,
+        (1, 1): UP_RIGHT,
+        (-1, 1): UP_LEFT,
+        (1, -1): DOWN_RIGHT,
+        (-1, -1): DOWN_LEFT
+    }
+
+    offsets_by_direction = {}
+
+    for (k, v) in direction_by_offsets.items():
+        offsets_by_direction[v] = k
+
+    reverse_moves = {
+        UP: DOWN,
+        RIGHT: LEFT,
+        UP_RIGHT: DOWN_LEFT,
+        UP_LEFT: DOWN_RIGHT
+    }
+
+    for (k, v) in reverse_moves.copy().items():
+        reverse_moves[v] = k
+
+    @classmethod
+    def opposite(cls, direction):
+        return cls.reverse_moves[direction]
+
+    @classmethod
+    def get_by_offsets(cls, row_offset, column_offset):
+        return cls.direction_by_offsets[(row_offset, column_offset)]
+
+    @classmethod
+    def get_offsets(cls, direction):
+        return cls.offsets_by_direction[direction]
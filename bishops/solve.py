@@ -0,0 +1,31 @@
+import argparse
+import sys
+
+from bishops import rules
+from puzzle_engine import cli
+
+
+def main(argv=None):
+    # Solves without a display: only the rules and the engine are
+    # imported, never OpenGL.
+    parser = argparse.ArgumentParser(
+        description='Solve the bishops puzzle headless.')
+    parser.add_argument(
+        '--height',
+        type=int,
+        default=4,
+        help='rows, and bishops of each colour (default: %(default)s)')
+    parser.add_argument(
+        '--width',
+        type=int,
+        default=5,
+        help='columns (default: %(default)s)')
+    cli.add_arguments(parser)
+    args = parser.parse_args(argv)
+    return cli.run(
+        rules.BishopsRules(args.height, args.width, symmetric=args.symmetric),
+        args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -41,11 +41,6 @@ class WaitForPieceSelection(BishopsState):
     def handle_click(cls, owner, x, y):
         piece = owner.board.select_game_piece(x, y)
         if piece is not None:
-            current_state_string =\
-                board.BoardState(owner.board).get_state_string()
-            current_state = owner.traversal.discovered_states.get(
-                current_state_string
-            )
             moves = owner.board.find_moves().get(piece)
             if moves is None or len(moves) == 0:
                 return
@@ -82,8 +77,10 @@ class WaitForMoveSelection(BishopsState):
     @classmethod
     def execute(cls,
                 owner):
+        # Auto moves start from WaitForPieceSelection, once the selection
+        # has been put back.
         if not owner.interactive:
-            owner.initiate_auto_move()
+            owner.state_machine.change_state(WaitForPieceSelection)
 
     @classmethod
     def handle_click(cls, owner, x, y):
@@ -135,10 +132,9 @@ class AnimateUserMove(BishopsState):
                 owner):
         owner.piece_to_move.update_animation(owner.current_time)
         if owner.current_time > owner.animate_end:
-            if owner.interactive:
-                owner.state_machine.change_state(WaitForPieceSelection)
-            else:
-                owner.initiate_auto_move()
+            # WaitForPieceSelection starts auto moves once this move has
+            # been applied to the board.
+            owner.state_machine.change_state(WaitForPieceSelection)
 
 
 @implementer(statemachine.IState)
@@ -146,8 +142,7 @@ class AutoAnimate(BishopsState):
     @classmethod
     def enter(cls,
               owner):
-        (next_state, move) = next(owner.path)
-        owner.start_animation(move)
+        owner.start_animation(owner.path.popleft())
         
     @classmethod
     def exit(cls,
@@ -160,7 +155,7 @@ class AutoAnimate(BishopsState):
                 owner):
         owner.piece_to_move.update_animation(owner.current_time)
         if owner.current_time > owner.animate_end:
-            if owner.interactive:
+            if owner.interactive or not owner.path:
                 owner.state_machine.change_state(WaitForPieceSelection)
             else:
                 owner.state_machine.change_state(AutoAnimate)
@@ -0,0 +1,94 @@
+import argparse
+import random
+import sys
+
+from piano import rules
+from puzzle_engine import (
+    benchmark,
+    traversal)
+
+
+def create_traversal(symmetric=False):
+    return traversal.Traversal(
+        rules.PianoRules(symmetric=symmetric),
+        graph_directory=None)
+
+
+def build_graph():
+    puzzle_traversal = create_traversal()
+    graph, seconds = benchmark.time_call(puzzle_traversal.build_graph)
+    return {
+        'seconds': seconds,
+        'states': len(graph),
+        'edges': len(graph.neighbors),
+        'winning_states': len(graph.winning_nodes)}
+
+
+def build_map(symmetric):
+    puzzle_traversal = create_traversal(symmetric)
+    _, seconds = benchmark.time_call(puzzle_traversal.build_map)
+    return {
+        'seconds': seconds,
+        'states': len(puzzle_traversal.graph),
+        'edges': len(puzzle_traversal.graph.neighbors),
+        'winning_states': len(puzzle_traversal.graph.winning_nodes)}
+
+
+def get_sample_keys(graph, queries):
+    # The same positions from run to run, drawn from the state graph.
+    state_keys = list(graph.state_keys)
+    return random.Random(0).sample(state_keys, min(queries, len(state_keys)))
+
+
+def get_shortest_winning_path(symmetric, queries):
+    puzzle_traversal = create_traversal(symmetric)
+    puzzle_traversal.build_map()
+    state_keys = get_sample_keys(puzzle_traversal.graph, queries)
+
+    def follow_paths():
+        return sum(
+            len(list(puzzle_traversal.get_shortest_winning_path(state_key)))
+            for state_key in state_keys)
+
+    moves, seconds = benchmark.time_call(follow_paths)
+    return {
+        'seconds': seconds,
+        'states': len(state_keys),
+        'moves': moves}
+
+
+def find_moves(queries):
+    puzzle_traversal = create_traversal()
+    state_keys = get_sample_keys(puzzle_traversal.build_graph(), queries)
+
+    def find_all_moves():
+        return sum(
+            len(list(rules.find_state_moves(state_key)))
+            for state_key in state_keys)
+
+    moves, seconds = benchmark.time_call(find_all_moves)
+    return {
+        'seconds': seconds,
+        'states': len(state_keys),
+        'moves': moves}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the piano solver.')
+    benchmark.add_arguments(parser)
+    args = parser.parse_args(argv)
+    benchmark.run(
+        'piano',
+        [('build_graph', build_graph, ()),
+         ('build_map', build_map, (args.symmetric,)),
+         ('get_shortest_winning_path',
+          get_shortest_winning_path,
+          (args.symmetric, args.queries)),
+         ('find_moves', find_moves, (args.queries,))],
+        args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
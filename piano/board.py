@@ -1,6 +1,3 @@
-import collections
-import time
-
 from game_common import (
         interfaces)
 from game_common.twodee.geometry import (
@@ -9,15 +6,8 @@ from game_common.twodee.geometry import (
 from OpenGL import (GL, GLUT)
 import zope.interface
 
-Move = collections.namedtuple(
-    'Move',
-    ['piece_type',
-     'piece_from',
-     'piece_to',
-     'displaced_blank_cells',
-     'displaced_blanks',
-     'new_blank_cells',
-     'direction'])
+from piano import rules
+
 
 class Board:
     def __init__(self, pieces_by_type):
@@ -59,24 +49,17 @@ class Board:
 
     @classmethod
     def from_initial_state(cls):
-        piano = create_piano(0, 1)
-        chairs = [create_chair(2, 0),
-                  create_chair(2, 1),
-                  create_chair(2, 2),
-                  create_chair(2, 3)]
-        sofas = [create_sofa(0, 0),
-                 create_sofa(0, 3),
-                 create_sofa(3, 0),
-                 create_sofa(3, 3)]
-        bench = create_bench(3, 1)
-        blanks = [create_blank(4, 1),
-                  create_blank(4, 2)]
+        create_piece = {
+            'piano': create_piano,
+            'chair': create_chair,
+            'sofa': create_sofa,
+            'bench': create_bench,
+            'blank': create_blank}
         pieces_by_type = {
-            'piano': [piano],
-            'chair': chairs,
-            'sofa': sofas,
-            'bench': [bench],
-            'blank': blanks}
+            piece_type: [
+                create_piece[piece_type](row, column)
+                for (row, column) in positions]
+            for (piece_type, positions) in rules.INITIAL_POSITIONS.items()}
         return Board(pieces_by_type)
 
     def select_game_piece(self, x, y, piece_type='pieces'):
@@ -92,16 +75,45 @@ class Board:
 
     def find_moves(self):
         if self.moves_by_piece is None:
-            blank_cells = [
-                (blank.row, blank.column) 
-                for blank in self.blanks]
+            blanks_by_cell = {
+                (blank.row, blank.column): blank
+                for blank in self.blanks}
+            blank_mask = rules.get_cells_mask(blanks_by_cell)
             moves_by_piece = self.moves_by_piece = {}
             for piece in self.pieces:
-                moves_for_piece = piece.find_moves(self.blanks, blank_cells)
+                moves_for_piece = piece.find_moves(blank_mask, blanks_by_cell)
                 if moves_for_piece:
                     moves_by_piece[piece] = moves_for_piece
         return self.moves_by_piece
 
+    def find_blank_moves(self):
+        # Yields (piece, move) for the same moves as find_moves, but only
+        # looks at the pieces next to a blank, since no other piece can
+        # slide anywhere.  The order differs from find_moves.
+        pieces_by_cell = {}
+        for piece in self.pieces:
+            for row in range(piece.row, piece.row + piece.height):
+                for column in range(piece.column, piece.column + piece.width):
+                    pieces_by_cell[(row, column)] = piece
+        blanks_by_cell = {
+            (blank.row, blank.column): blank
+            for blank in self.blanks}
+        blank_mask = rules.get_cells_mask(blanks_by_cell)
+        checked = set()
+        for (row, column) in blanks_by_cell:
+            for (neighbor, direction) in (
+                    ((row + 1, column), Direction.UP),
+                    ((row - 1, column), Direction.DOWN),
+                    ((row, column + 1), Direction.LEFT),
+                    ((row, column - 1), Direction.RIGHT)):
+                piece = pieces_by_cell.get(neighbor)
+                if piece is None or (piece, direction) in checked:
+                    continue
+                checked.add((piece, direction))
+                move = piece.find_move(direction, blank_mask, blanks_by_cell)
+                if move is not None:
+                    yield (piece, move)
+
     def update_pieces_from_board(self, board):
         self.moves_by_piece = None
         for piece_type, pieces in self.pieces_by_type.items():
@@ -110,9 +122,12 @@ class Board:
                     board.pieces_by_type[piece_type][piece_index])
 
     def update_pieces_from_state(self, state):
+        self.update_pieces_from_positions(state.pieces_by_type)
+
+    def update_pieces_from_positions(self, positions):
         self.moves_by_piece = None
         for piece_type, pieces in self.pieces_by_type.items():
-            state_pieces_for_type = state.pieces_by_type[piece_type]
+            state_pieces_for_type = positions[piece_type]
             for piece_index in range(len(pieces)):
                 piece = pieces[piece_index]
                 piece.row, piece.column = state_pieces_for_type[piece_index]
@@ -159,113 +174,39 @@ class BoardPiece:
         self.row = piece.row
         self.board.finish_move()
 
-    def check_up(self, blanks, blank_cells):
-        if self.row - 1 < 0:
-            return False
-        up_row = [(self.row - 1, self.column + x) for x in range(self.width)]
-        matched_blanks = []
-        for cell in up_row:
-            if cell in blank_cells:
-                matched_blanks.append(self._get_blank_by_cell(cell, blanks))
-            else:
-                return False
-        new_blanks = [(self.row + (self.height - 1), self.column + x) for x in range(self.width)]
-        new_base = (self.row - 1, self.column)
-        return Move(
-            piece_type=self.piece_type,
-            piece_from=(self.row, self.column),
-            piece_to=new_base,
-            displaced_blank_cells=up_row,
-            displaced_blanks=matched_blanks,
-            new_blank_cells=new_blanks,
-            direction=Direction.UP)
-
-    def check_down(self, blanks, blank_cells):
-        if self.row + self.height > 4:
-            return False
-        down_row = [(self.row + self.height, self.column + x) for x in range(self.width)]
-        matched_blanks = []
-        for cell in down_row:
-            if cell in blank_cells:
-                matched_blanks.append(self._get_blank_by_cell(cell, blanks))
-            else:
-                return False
-        new_blanks = [(self.row, self.column + x) for x in range(self.width)]
-        new_base = (self.row + 1, self.column)
-        return Move(
-            piece_type=self.piece_type,
-            piece_from=(self.row, self.column),
-            piece_to=new_base,
-            displaced_blank_cells=down_row,
-            displaced_blanks=matched_blanks,
-            new_blank_cells=new_blanks,
-            direction=Direction.DOWN)
-
-    def check_left(self, blanks, blank_cells):
-        if self.column - 1 < 0:
-            return False
-        left_column = [(self.row + x, self.column - 1) for x in range(self.height)]
-        matched_blanks = []
-        for cell in left_column:
-            if cell in blank_cells:
-                matched_blanks.append(self._get_blank_by_cell(cell, blanks))
-            else:
-                return False
-        new_blanks = [(self.row + x, self.column + (self.width - 1)) for x in range(self.height)]
-        new_base = (self.row, self.column - 1)
-        return Move(
-            piece_type=self.piece_type,
-            piece_from=(self.row, self.column),
-            piece_to=new_base,
-            displaced_blank_cells=left_column,
-            displaced_blanks=matched_blanks,
-            new_blank_cells=new_blanks,
-            direction=Direction.LEFT)
-
-    def check_right(self, blanks, blank_cells):
-        if self.column + self.width > 3:
-            return False
-        right_column = [(self.row + x, self.column + self.width) for x in range(self.height)]
-        matched_blanks = []
-        for cell in right_column:
-            if cell in blank_cells:
-                matched_blanks.append(self._get_blank_by_cell(cell, blanks))
-            else:
-                return False
-
-        new_blanks = [(self.row + x, self.column) for x in range(self.height)]
-        new_base = (self.row, self.column + 1)
-
-        return Move(
-            piece_type=self.piece_type,
-            piece_from=(self.row, self.column),
-            piece_to=new_base,
-            displaced_blank_cells=right_column,
-            displaced_blanks=matched_blanks,
-            new_blank_cells=new_blanks,
-            direction=Direction.RIGHT)
-
-    def _get_blank_by_cell(self, cell, blanks):
-        for blank in blanks:
-            if (blank.row, blank.column) == cell:
-                return blank
-
-    def find_moves(self, blanks, blank_cells):
-        up = self.check_up(blanks, blank_cells)
-        down = self.check_down(blanks, blank_cells)
-        left = self.check_left(blanks, blank_cells)
-        right = self.check_right(blanks, blank_cells)
+    def find_moves(self, blank_mask, blanks_by_cell):
         moves = []
-        if up:
-            moves.append(up)
-        if down:
-            moves.append(down)
-        if left:
-            moves.append(left)
-        if right:
-            moves.append(right)
+        move_table = rules.get_move_table(self.piece_type)[
+            (self.row, self.column)]
+        for move_cells in move_table:
+            if move_cells.required_mask & blank_mask != move_cells.required_mask:
+                continue
+            moves.append(self._create_move(move_cells, blanks_by_cell))
         return moves
 
+    def find_move(self, direction, blank_mask, blanks_by_cell):
+        move_table = rules.get_move_table(self.piece_type)[
+            (self.row, self.column)]
+        for move_cells in move_table:
+            if move_cells.direction != direction:
+                continue
+            if move_cells.required_mask & blank_mask != move_cells.required_mask:
+                return None
+            return self._create_move(move_cells, blanks_by_cell)
+        return None
+
+    def _create_move(self, move_cells, blanks_by_cell):
+        return rules.Move(
+            piece_type=self.piece_type,
+            piece_from=(self.row, self.column),
+            piece_to=move_cells.piece_to,
+            displaced_blank_cells=move_cells.displaced_blank_cells,
+            displaced_blanks=[
+                blanks_by_cell[cell]
+                for cell in move_cells.displaced_blank_cells],
+            new_blank_cells=move_cells.new_blank_cells,
+            direction=move_cells.direction)
+
     # Renderable
 
     def init_renderable(self):
@@ -382,22 +323,32 @@ class BoardPiece:
         GL.glPopMatrix()
 
 def create_piano(row, column):
-    return BoardPiece(row, column, height=2, width=2, piece_type='piano')
+    height, width = rules.PIECE_SHAPES['piano']
+    return BoardPiece(
+        row, column, height=height, width=width, piece_type='piano')
 
 def create_chair(row, column):
-    return BoardPiece(row, column, height=1, width=1, piece_type='chair')
+    height, width = rules.PIECE_SHAPES['chair']
+    return BoardPiece(
+        row, column, height=height, width=width, piece_type='chair')
 
 def create_sofa(row, column):
-    return BoardPiece(row, column, height=2, width=1, piece_type='sofa')
+    height, width = rules.PIECE_SHAPES['sofa']
+    return BoardPiece(
+        row, column, height=height, width=width, piece_type='sofa')
 
 def create_bench(row, column):
-    return BoardPiece(row, column, height=1, width=2, piece_type='bench')
+    height, width = rules.PIECE_SHAPES['bench']
+    return BoardPiece(
+        row, column, height=height, width=width, piece_type='bench')
 
 def create_blank(row, column):
-    return BoardPiece(row, column, height=1, width=1, piece_type='blank')
+    height, width = rules.PIECE_SHAPES['blank']
+    return BoardPiece(
+        row, column, height=height, width=width, piece_type='blank')
 
 class BoardState:
-    def __init__(self, board, move=0):
+    def __init__(self, board):
         self.initialize_rows()
         self.pieces_by_type = {
             'piano': [],
@@ -405,11 +356,11 @@ class BoardState:
             'chair': [],
             'bench': [],
             'blank': []}
+        self.state_key = 0
         self.plot_pieces(board)
-        self.state_string = self.get_state_string()
-        self.adjacent_states = {}
-        self.move = move
-        self.moves_from_winning_states = []
+
+    def is_winning(self):
+        return self.pieces_by_type['piano'][0] == rules.WINNING_PIANO_CELL
 
     def initialize_rows(self):
         self.rows = [
@@ -425,10 +376,19 @@ class BoardState:
     def plot_pieces(self, board):
         for piece_type, pieces in board.pieces_by_type.items():
             for piece in pieces:
+                digit = rules.STATE_DIGITS[piece.symbol]
                 self.pieces_by_type[piece_type].append((piece.row, piece.column))
                 for column_offset in range(piece.width):
                     for row_offset in range(piece.height):
-                        self.rows[piece.row + row_offset][piece.column + column_offset] = piece.symbol
+                        row = piece.row + row_offset
+                        column = piece.column + column_offset
+                        self.rows[row][column] = piece.symbol
+                        cell = row * rules.STATE_COLUMNS + column
+                        self.state_key += digit * rules.STATE_POWERS[cell]
+
+    @property
+    def state_string(self):
+        return self.get_state_string()
 
     def print_self(self):
         for row in self.rows:
@@ -437,165 +397,9 @@ class BoardState:
     def get_state_string(self):
         return ''.join([''.join(x) for x in self.rows])
 
-    def connect(self, other_state, move_info):
-        forward = move_info
-        backward = reverse_move_info(forward)
-        self.adjacent_states[other_state.state_string] = (other_state, forward)
-        other_state.adjacent_states[self.state_string] = (self, backward)
-
-
-def reverse_move_info(move):
-    backward = Move(
-        piece_type=move.piece_type,
-        piece_from=move.piece_to,
-        piece_to=move.piece_from,
-        displaced_blank_cells=move.new_blank_cells,
-        new_blank_cells=move.displaced_blank_cells,
-        displaced_blanks=move.displaced_blanks,
-        direction=Direction.opposite(move.direction))
-    return backward
-
-        
-class Traversal:
-    def __init__(self):
-        board = Board.from_initial_state()
-        self.board = board
-        self.next_board = board.copy()
-        self.starting_state = BoardState(board=board)
-        self.discovered_states = {
-            self.starting_state.state_string: self.starting_state}
-        self.current_state = None
-
-
-    def get_shortest_winning_path(self, current_state):
-        path_index = 0
-        current_min = current_state.moves_from_winning_states[0]
-        for i in range(len(current_state.moves_from_winning_states[1:])):
-            moves = current_state.moves_from_winning_states[i]
-            if moves < current_min:
-                path_index = i
-                current_min = moves
-
-        moves = current_min
-
-        while moves > 0:
-            adjacent_states = current_state.adjacent_states
-            for (adjacent_state, move) in adjacent_states.values():
-                if adjacent_state.moves_from_winning_states[path_index] < moves:
-                    current_state = adjacent_state
-                    yield (current_state, move)
-                    moves = current_state.moves_from_winning_states[path_index]
-                    break
-
-
-    def get_all_winning_paths(self, starting_state=None):
-        if starting_state is None:
-            starting_state = self.starting_state
-        paths = []
-        for winning_state in self.winning_states:
-            current_state = winning_state
-            path = [(current_state, None)]
-            while current_state != starting_state:
-                next_state = None
-                backward_move = None
-                adjacent_states = current_state.adjacent_states
-                for (adjacent_state, backward) in adjacent_states.values():
-                    if adjacent_state.move == current_state.move - 1:
-                        next_state = adjacent_state
-                        backward_move = backward
-                        break
-                if next_state is None:
-                    raise Exception('Cannot build path back from {}'.format(
-                        current_state))
-                else:
-                    current_state = next_state
-                    path.insert(
-                        0,
-                        (current_state,
-                         reverse_move_info(backward_move)))
-            paths.append(path)
-        return paths
-
-    def build_map(self):
-        print('Discovering winning states')
-        winning_states = self.discover_all_winning_states()
-        print('Winning states disccovered')
-        path_index = 0
-        for winning_state in winning_states:
-            print('Mapping path {}'.format(path_index))
-            moves = 0
-            state_queue = [winning_state]
-            mapped_states = {winning_state}
-            winning_state.moves_from_winning_states.append(0)
-            while state_queue:
-                current_state = state_queue.pop(0)
-                move_number =\
-                    current_state.moves_from_winning_states[path_index] + 1
-                adjacent_states = current_state.adjacent_states
-                for (adjacent_state, _) in adjacent_states.values():
-                    if adjacent_state in mapped_states:
-                        continue
-                    mapped_states.add(adjacent_state)
-                    adjacent_state.moves_from_winning_states.append(move_number)
-                    state_queue.append(adjacent_state)
-            print('Finished map for path {}'.format(path_index))
-            path_index += 1
-
-    def discover_all_winning_states(self):
-        count = 0
-        winning_states = []
-        state_queue = [self.starting_state]
-        while state_queue:
-            count += 1
-            self.current_state = state_queue.pop(0)
-            self.board.update_pieces_from_state(self.current_state)
-            self.next_board.update_pieces_from_board(self.board)
-            piano = self.board.piano
-            if (piano.row, piano.column) == (3, 1):
-                winning_states.append(self.current_state)
-                continue
-
-            moves_by_piece = self.next_board.find_moves()
-            for (piece, moves_for_piece) in moves_by_piece.items():
-                for move in moves_for_piece:
-                    piece.row, piece.column = move.piece_to
-                    for blank_index in range(len(move.displaced_blanks)):
-                        blank = move.displaced_blanks[blank_index]
-                        (blank.row,
-                         blank.column) = move.new_blank_cells[blank_index]
-                    board_state_candidate =\
-                        BoardState(
-                            board=self.next_board,
-                            move=self.current_state.move + 1)
-                    existing_board_state =\
-                        self.discovered_states.get(
-                            board_state_candidate.state_string)
-                    if existing_board_state:
-                        board_state = existing_board_state
-                    else:
-                        board_state = board_state_candidate
-                        self.discovered_states[board_state.state_string] =\
-                            board_state
-                        state_queue.append(board_state)
-
-                    self.current_state.connect(
-                        board_state,
-                        move)
-                    self.next_board.update_pieces_from_board(self.board)
-            time.sleep(.00001)
-        self.winning_states = winning_states
-        return winning_states
-
-
-    def print_board(self):
-        self.current_state.print_self()
-
-class Direction:
-    UP = 0
-    RIGHT = 1
-    DOWN = 2
-    LEFT = 3
 
+class Direction(rules.Direction):
+    # The arrow keys that pick a direction in the UI.
     keys = (
         GLUT.GLUT_KEY_UP,
         GLUT.GLUT_KEY_RIGHT,
@@ -608,7 +412,3 @@ class Direction:
     for i in range(4):
         direction_by_key[keys[i]] = i
         key_by_direction[i] = keys[i]
-
-    @classmethod
-    def opposite(cls, direction):
-        return (direction + 2) % 4
@@ -1,7 +1,3 @@
-from game_common import canvas
-
-import piano_world
-
 def flatten(*args):
     l = []
     for arg in args:
@@ -13,6 +9,11 @@ def flatten(*args):
 
 
 def main():
+    # Imported here rather than at the top so that nothing but the GUI
+    # pulls in OpenGL; piano.solve runs the solver headless.
+    from game_common import canvas
+    import piano_world
+
     world = piano_world.PianoWorld()
     piano_canvas = canvas.Canvas(
             world=world,
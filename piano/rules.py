@@ -0,0 +1,505 @@
+import array
+import bisect
+import collections
+import functools
+
+from puzzle_engine import rules
+
+Move = collections.namedtuple(
+    'Move',
+    ['piece_type',
+     'piece_from',
+     'piece_to',
+     'displaced_blank_cells',
+     'displaced_blanks',
+     'new_blank_cells',
+     'direction'])
+
+# Each cell of a state key is one base-5 digit, indexed by symbol.
+STATE_SYMBOLS = (' ', 'P', 'B', 'S', 'C')
+STATE_DIGITS = {symbol: digit for (digit, symbol) in enumerate(STATE_SYMBOLS)}
+STATE_BASE = len(STATE_SYMBOLS)
+STATE_ROWS = 5
+STATE_COLUMNS = 4
+STATE_POWERS = [STATE_BASE ** cell for cell in range(STATE_ROWS * STATE_COLUMNS)]
+
+
+def encode_state(state_string):
+    state_key = 0
+    for cell in range(len(state_string)):
+        state_key += STATE_DIGITS[state_string[cell]] * STATE_POWERS[cell]
+    return state_key
+
+
+def decode_state(state_key):
+    symbols = []
+    for cell in range(STATE_ROWS * STATE_COLUMNS):
+        state_key, digit = divmod(state_key, STATE_BASE)
+        symbols.append(STATE_SYMBOLS[digit])
+    return ''.join(symbols)
+
+
+PIECE_SHAPES = {
+    'piano': (2, 2),
+    'chair': (1, 1),
+    'sofa': (2, 1),
+    'bench': (1, 2),
+    'blank': (1, 1)}
+PIECE_TYPES_BY_SYMBOL = {
+    'P': 'piano',
+    'B': 'bench',
+    'S': 'sofa',
+    'C': 'chair',
+    ' ': 'blank'}
+SYMBOLS_BY_PIECE_TYPE = {
+    piece_type: symbol
+    for (symbol, piece_type) in PIECE_TYPES_BY_SYMBOL.items()}
+MOVABLE_PIECE_TYPES = ('piano', 'chair', 'sofa', 'bench')
+WINNING_PIANO_CELL = (3, 1)
+# Where each piece starts, in the piece type order of Board.
+INITIAL_POSITIONS = {
+    'piano': [(0, 1)],
+    'chair': [(2, 0), (2, 1), (2, 2), (2, 3)],
+    'sofa': [(0, 0), (0, 3), (3, 0), (3, 3)],
+    'bench': [(3, 1)],
+    'blank': [(4, 1), (4, 2)]}
+RULES_VERSION = 1
+
+
+def decode_positions(state_key):
+    # Identical pieces are interchangeable, so the first unclaimed cell of
+    # a symbol in row-major order is always the base of one of its pieces.
+    state_string = decode_state(state_key)
+    positions = {piece_type: [] for piece_type in PIECE_SHAPES}
+    claimed = set()
+    for cell in range(len(state_string)):
+        if cell in claimed:
+            continue
+        piece_type = PIECE_TYPES_BY_SYMBOL[state_string[cell]]
+        row, column = divmod(cell, STATE_COLUMNS)
+        positions[piece_type].append((row, column))
+        height, width = PIECE_SHAPES[piece_type]
+        for row_offset in range(height):
+            for column_offset in range(width):
+                claimed.add(
+                    (row + row_offset) * STATE_COLUMNS + column + column_offset)
+    return positions
+
+
+def encode_positions(positions):
+    state_key = 0
+    for (piece_type, piece_positions) in positions.items():
+        for position in piece_positions:
+            state_key += _get_cells_value(
+                piece_type,
+                _get_piece_cells(piece_type, position))
+    return state_key
+
+
+def is_placement(state_key):
+    # Whether state_key is a board fully tiled by whole pieces, with one
+    # piano.
+    positions = decode_positions(state_key)
+    if len(positions['piano']) != 1:
+        return False
+    for (piece_type, piece_positions) in positions.items():
+        for position in piece_positions:
+            if _get_piece_cells(piece_type, position) is None:
+                return False
+    return encode_positions(positions) == state_key
+
+
+def enumerate_placements(piece_counts, fixed_positions):
+    # Yields the state key of every way to fill the board with piece_counts
+    # pieces of each type (blanks included), with the pieces in
+    # fixed_positions already placed.
+    occupied = [False] * (STATE_ROWS * STATE_COLUMNS)
+    remaining = dict(piece_counts)
+    state_key = 0
+    for (piece_type, positions) in fixed_positions.items():
+        for position in positions:
+            cells = _get_piece_cells(piece_type, position)
+            for cell in cells:
+                occupied[cell] = True
+            state_key += _get_cells_value(piece_type, cells)
+            remaining[piece_type] -= 1
+    yield from _fill_placements(0, occupied, remaining, state_key)
+
+
+def _fill_placements(cell, occupied, remaining, state_key):
+    while cell < len(occupied) and occupied[cell]:
+        cell += 1
+    if cell == len(occupied):
+        yield state_key
+        return
+    position = divmod(cell, STATE_COLUMNS)
+    for piece_type in remaining:
+        if not remaining[piece_type]:
+            continue
+        cells = _get_piece_cells(piece_type, position)
+        if cells is None or any(occupied[x] for x in cells):
+            continue
+        for piece_cell in cells:
+            occupied[piece_cell] = True
+        remaining[piece_type] -= 1
+        yield from _fill_placements(
+            cell + 1,
+            occupied,
+            remaining,
+            state_key + _get_cells_value(piece_type, cells))
+        remaining[piece_type] += 1
+        for piece_cell in cells:
+            occupied[piece_cell] = False
+
+
+def _get_piece_cells(piece_type, position):
+    height, width = PIECE_SHAPES[piece_type]
+    row, column = position
+    if row + height > STATE_ROWS or column + width > STATE_COLUMNS:
+        return None
+    return [
+        (row + row_offset) * STATE_COLUMNS + column + column_offset
+        for row_offset in range(height)
+        for column_offset in range(width)]
+
+
+def _get_cells_value(piece_type, cells):
+    digit = STATE_DIGITS[SYMBOLS_BY_PIECE_TYPE[piece_type]]
+    return digit * sum(STATE_POWERS[cell] for cell in cells)
+
+
+def sum_cell_powers(cells):
+    return sum(
+        STATE_POWERS[row * STATE_COLUMNS + column] for (row, column) in cells)
+
+
+def get_move_cells(piece_type, piece_from, direction):
+    # Returns (piece_to, displaced_blank_cells, new_blank_cells), with the
+    # cells ordered along the edge the piece moves across.
+    height, width = PIECE_SHAPES[piece_type]
+    row, column = piece_from
+    if direction == Direction.UP:
+        return (
+            (row - 1, column),
+            [(row - 1, column + x) for x in range(width)],
+            [(row + (height - 1), column + x) for x in range(width)])
+    elif direction == Direction.DOWN:
+        return (
+            (row + 1, column),
+            [(row + height, column + x) for x in range(width)],
+            [(row, column + x) for x in range(width)])
+    elif direction == Direction.LEFT:
+        return (
+            (row, column - 1),
+            [(row + x, column - 1) for x in range(height)],
+            [(row + x, column + (width - 1)) for x in range(height)])
+    elif direction == Direction.RIGHT:
+        return (
+            (row, column + 1),
+            [(row + x, column + width) for x in range(height)],
+            [(row + x, column) for x in range(height)])
+    else:
+        raise NotImplementedError()
+
+
+def get_cells_mask(cells):
+    cells_mask = 0
+    for (row, column) in cells:
+        cells_mask |= 1 << (row * STATE_COLUMNS + column)
+    return cells_mask
+
+
+MoveCells = collections.namedtuple(
+    'MoveCells',
+    ['direction',
+     'piece_to',
+     'required_mask',
+     'vacated_mask',
+     'displaced_blank_cells',
+     'new_blank_cells'])
+
+
+@functools.lru_cache(maxsize=None)
+def get_move_table(piece_type):
+    # Maps every base position of piece_type to the moves that stay on the
+    # board, in up, down, left, right order.  A move is legal when every
+    # cell of required_mask is blank; it leaves vacated_mask blank.
+    height, width = PIECE_SHAPES[piece_type]
+    move_table = {}
+    for row in range(STATE_ROWS - height + 1):
+        for column in range(STATE_COLUMNS - width + 1):
+            moves = []
+            for direction in (
+                    Direction.UP,
+                    Direction.DOWN,
+                    Direction.LEFT,
+                    Direction.RIGHT):
+                piece_to, displaced_blank_cells, new_blank_cells =\
+                    get_move_cells(piece_type, (row, column), direction)
+                if not all(
+                        0 <= cell_row < STATE_ROWS and
+                        0 <= cell_column < STATE_COLUMNS
+                        for (cell_row, cell_column) in displaced_blank_cells):
+                    continue
+                moves.append(MoveCells(
+                    direction=direction,
+                    piece_to=piece_to,
+                    required_mask=get_cells_mask(displaced_blank_cells),
+                    vacated_mask=get_cells_mask(new_blank_cells),
+                    displaced_blank_cells=displaced_blank_cells,
+                    new_blank_cells=new_blank_cells))
+            move_table[(row, column)] = tuple(moves)
+    return move_table
+
+
+MIRRORED_CELLS = [
+    row * STATE_COLUMNS + (STATE_COLUMNS - 1 - column)
+    for row in range(STATE_ROWS)
+    for column in range(STATE_COLUMNS)]
+
+
+def mirror_state_key(state_key):
+    # The board and the goal are symmetric under a left-right mirror.
+    mirrored_key = 0
+    for cell in range(STATE_ROWS * STATE_COLUMNS):
+        state_key, digit = divmod(state_key, STATE_BASE)
+        mirrored_key += digit * STATE_POWERS[MIRRORED_CELLS[cell]]
+    return mirrored_key
+
+
+def mirror_move(move):
+    height, width = PIECE_SHAPES[move.piece_type]
+    row, column = move.piece_from
+    direction = move.direction
+    if direction in (Direction.LEFT, Direction.RIGHT):
+        direction = Direction.opposite(direction)
+    piece_from = (row, STATE_COLUMNS - column - width)
+    piece_to, displaced_blank_cells, new_blank_cells = get_move_cells(
+        move.piece_type,
+        piece_from,
+        direction)
+    return Move(
+        piece_type=move.piece_type,
+        piece_from=piece_from,
+        piece_to=piece_to,
+        displaced_blank_cells=displaced_blank_cells,
+        displaced_blanks=[],
+        new_blank_cells=new_blank_cells,
+        direction=direction)
+
+
+def move_state_key(state_key, move):
+    digit = STATE_DIGITS[SYMBOLS_BY_PIECE_TYPE[move.piece_type]]
+    return state_key + digit * (
+        sum_cell_powers(move.displaced_blank_cells) -
+        sum_cell_powers(move.new_blank_cells))
+
+
+def pack_move(move):
+    from_cell = move.piece_from[0] * STATE_COLUMNS + move.piece_from[1]
+    return (
+        (MOVABLE_PIECE_TYPES.index(move.piece_type) * STATE_ROWS *
+         STATE_COLUMNS + from_cell) * 4 + move.direction)
+
+
+def unpack_move(move_code):
+    rest, direction = divmod(move_code, 4)
+    type_index, from_cell = divmod(rest, STATE_ROWS * STATE_COLUMNS)
+    piece_type = MOVABLE_PIECE_TYPES[type_index]
+    piece_from = divmod(from_cell, STATE_COLUMNS)
+    piece_to, displaced_blank_cells, new_blank_cells = get_move_cells(
+        piece_type,
+        piece_from,
+        direction)
+    return Move(
+        piece_type=piece_type,
+        piece_from=piece_from,
+        piece_to=piece_to,
+        displaced_blank_cells=displaced_blank_cells,
+        displaced_blanks=[],
+        new_blank_cells=new_blank_cells,
+        direction=direction)
+
+
+def find_state_moves(state_key):
+    # Yields the moves of Board.find_blank_moves, in the same order, for
+    # the position state_key without setting up a board.  The moves carry
+    # no displaced blank pieces.
+    positions = decode_positions(state_key)
+    pieces_by_cell = {}
+    for piece_type in MOVABLE_PIECE_TYPES:
+        for position in positions[piece_type]:
+            for cell in _get_piece_cells(piece_type, position):
+                pieces_by_cell[divmod(cell, STATE_COLUMNS)] = (
+                    piece_type,
+                    position)
+    blank_mask = get_cells_mask(positions['blank'])
+    checked = set()
+    for (row, column) in positions['blank']:
+        for (neighbor, direction) in (
+                ((row + 1, column), Direction.UP),
+                ((row - 1, column), Direction.DOWN),
+                ((row, column + 1), Direction.LEFT),
+                ((row, column - 1), Direction.RIGHT)):
+            piece = pieces_by_cell.get(neighbor)
+            if piece is None or (piece, direction) in checked:
+                continue
+            checked.add((piece, direction))
+            piece_type, position = piece
+            for move_cells in get_move_table(piece_type)[position]:
+                if move_cells.direction != direction:
+                    continue
+                required_mask = move_cells.required_mask
+                if required_mask & blank_mask == required_mask:
+                    yield Move(
+                        piece_type=piece_type,
+                        piece_from=position,
+                        piece_to=move_cells.piece_to,
+                        displaced_blank_cells=move_cells.displaced_blank_cells,
+                        displaced_blanks=[],
+                        new_blank_cells=move_cells.new_blank_cells,
+                        direction=direction)
+                break
+
+
+def reverse_move_info(move):
+    backward = Move(
+        piece_type=move.piece_type,
+        piece_from=move.piece_to,
+        piece_to=move.piece_from,
+        displaced_blank_cells=move.new_blank_cells,
+        new_blank_cells=move.displaced_blank_cells,
+        displaced_blanks=move.displaced_blanks,
+        direction=Direction.opposite(move.direction))
+    return backward
+
+
+class PlacementCodec(rules.StateCodec):
+    # There is no closed form for ranking placements of mixed piece shapes,
+    # so a placement's rank is its index among every legal placement,
+    # sorted by state key.
+    def __init__(self, piece_counts):
+        self.placement_keys = array.array(
+            'Q',
+            sorted(enumerate_placements(piece_counts, {})))
+        self.count = len(self.placement_keys)
+
+    def rank(self, state_key):
+        rank = bisect.bisect_left(self.placement_keys, state_key)
+        if (rank == self.count or
+                self.placement_keys[rank] != state_key):
+            raise KeyError(state_key)
+        return rank
+
+    def unrank(self, rank):
+        return self.placement_keys[rank]
+
+
+class PianoRules(rules.Rules):
+    name = 'piano'
+    version = RULES_VERSION
+    expand_goals = False
+
+    def __init__(self, start_key=None, symmetric=False):
+        if start_key is None:
+            start_key = encode_positions(INITIAL_POSITIONS)
+        self.start_key = start_key
+        # With symmetric set, a state and its mirror image share one node of
+        # the state graph, and paths are un-mirrored as they are walked.
+        self.symmetric = symmetric
+        positions = decode_positions(start_key)
+        self.piece_counts = {
+            piece_type: len(positions[piece_type])
+            for piece_type in PIECE_SHAPES}
+        # Both built on first use, which keeps the rules cheap to pickle
+        # into worker processes.
+        self.goal_keys = None
+        self.codec = None
+
+    def get_identity(self):
+        return (STATE_ROWS, STATE_COLUMNS)
+
+    def encode(self, board):
+        return encode_positions({
+            piece_type: [(piece.row, piece.column) for piece in pieces]
+            for (piece_type, pieces) in board.pieces_by_type.items()})
+
+    def get_start_key(self):
+        return self.start_key
+
+    def successors(self, state_key):
+        for move in find_state_moves(state_key):
+            yield (move_state_key(state_key, move), move)
+
+    def is_goal(self, state_key):
+        return decode_positions(state_key)['piano'][0] == WINNING_PIANO_CELL
+
+    def get_goal_keys(self):
+        if self.goal_keys is None:
+            self.goal_keys = list(enumerate_placements(
+                self.piece_counts,
+                {'piano': [WINNING_PIANO_CELL]}))
+        return self.goal_keys
+
+    def reverse_move(self, move):
+        return reverse_move_info(move)
+
+    def apply_move(self, state_key, move):
+        return move_state_key(state_key, move)
+
+    def pack_move(self, move):
+        return pack_move(move)
+
+    def unpack_move(self, move_code):
+        return unpack_move(move_code)
+
+    def estimate_moves(self, state_key):
+        # Manhattan distance of the piano to its target, plus one move for
+        # every other piece standing where the piano has to go.
+        positions = decode_positions(state_key)
+        piano_position = positions['piano'][0]
+        moves = (
+            abs(piano_position[0] - WINNING_PIANO_CELL[0]) +
+            abs(piano_position[1] - WINNING_PIANO_CELL[1]))
+        if moves == 0:
+            return 0
+        blocked_cells = (
+            set(_get_piece_cells('piano', WINNING_PIANO_CELL)) -
+            set(_get_piece_cells('piano', piano_position)))
+        for piece_type in MOVABLE_PIECE_TYPES:
+            if piece_type == 'piano':
+                continue
+            for position in positions[piece_type]:
+                if blocked_cells.intersection(
+                        _get_piece_cells(piece_type, position)):
+                    moves += 1
+        return moves
+
+    def canonicalize(self, state_key):
+        # Returns (canonical_key, mirrored).
+        if self.symmetric:
+            mirrored_key = mirror_state_key(state_key)
+            if mirrored_key < state_key:
+                return mirrored_key, True
+        return state_key, False
+
+    def transform_move(self, move, mirrored):
+        if mirrored:
+            return mirror_move(move)
+        return move
+
+    def get_codec(self):
+        if self.codec is None:
+            self.codec = PlacementCodec(self.piece_counts)
+        return self.codec
+
+
+class Direction:
+    UP = 0
+    RIGHT = 1
+    DOWN = 2
+    LEFT = 3
+
+    @classmethod
+    def opposite(cls, direction):
+        return (direction + 2) % 4
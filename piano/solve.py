@@ -0,0 +1,40 @@
+import argparse
+import sys
+
+from piano import rules
+from puzzle_engine import cli
+
+
+def main(argv=None):
+    # Solves without a display: only the rules and the engine are
+    # imported, never OpenGL.
+    parser = argparse.ArgumentParser(
+        description='Solve the piano puzzle headless.')
+    parser.add_argument(
+        '--position',
+        default=None,
+        help=(
+            'the board to solve from as {} symbols, row by row, from {!r} '
+            '(default: the opening position)'.format(
+                rules.STATE_ROWS * rules.STATE_COLUMNS,
+                ''.join(rules.STATE_SYMBOLS))))
+    cli.add_arguments(parser)
+    args = parser.parse_args(argv)
+    state_key = None
+    if args.position is not None:
+        if (len(args.position) != rules.STATE_ROWS * rules.STATE_COLUMNS or
+                set(args.position) - set(rules.STATE_SYMBOLS)):
+            parser.error('--position must be {} of {!r}'.format(
+                rules.STATE_ROWS * rules.STATE_COLUMNS,
+                ''.join(rules.STATE_SYMBOLS)))
+        state_key = rules.encode_state(args.position)
+        if not rules.is_placement(state_key):
+            parser.error('--position is not a board of whole pieces')
+    return cli.run(
+        rules.PianoRules(state_key, symmetric=args.symmetric),
+        args,
+        state_key=state_key)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
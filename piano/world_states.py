@@ -75,8 +75,10 @@ class WaitForMoveSelection(PianoState):
     @classmethod
     def execute(cls,
                 owner):
+        # Auto moves start from WaitForPieceSelection, once the selection
+        # has been put back.
         if not owner.interactive:
-            owner.initiate_auto_move()
+            owner.state_machine.change_state(WaitForPieceSelection)
 
     @classmethod
     def handle_click(cls, owner, x, y):
@@ -136,10 +138,9 @@ class AnimateUserMove(PianoState):
                 owner):
         owner.piece_to_move.update_animation(owner.current_time)
         if owner.current_time > owner.animate_end:
-            if owner.interactive:
-                owner.state_machine.change_state(WaitForPieceSelection)
-            else:
-                owner.initiate_auto_move()
+            # WaitForPieceSelection starts auto moves once this move has
+            # been applied to the board.
+            owner.state_machine.change_state(WaitForPieceSelection)
 
 
 @implementer(statemachine.IState)
@@ -147,8 +148,7 @@ class AutoAnimate(PianoState):
     @classmethod
     def enter(cls,
               owner):
-        (next_state, move) = next(owner.path)
-        owner.start_animation(move)
+        owner.start_animation(owner.path.popleft())
         
     @classmethod
     def exit(cls,
@@ -161,7 +161,7 @@ class AutoAnimate(PianoState):
                 owner):
         owner.piece_to_move.update_animation(owner.current_time)
         if owner.current_time > owner.animate_end:
-            if owner.interactive:
+            if owner.interactive or not owner.path:
                 owner.state_machine.change_state(WaitForPieceSelection)
             else:
                 owner.state_machine.change_state(AutoAnimate)
@@ -0,0 +1,124 @@
+import concurrent.futures
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+
+
+def time_call(function, *args):
+    # Returns (result, seconds).
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--output',
+        default=None,
+        help='write the results to this JSON file')
+    parser.add_argument(
+        '--compare',
+        default=None,
+        help='a JSON file from an earlier run to compare wall times with')
+    parser.add_argument(
+        '--queries',
+        type=int,
+        default=1000,
+        help='positions sampled for path and move queries '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '--symmetric',
+        action='store_true',
+        help='fold symmetric positions together in the maps')
+
+
+def _run_case(case, args):
+    # Runs in a fresh process per case, so that the peak RSS is the case's
+    # own and no case warms caches for the next.
+    measurement = case(*args)
+    measurement['peak_rss_kb'] = get_peak_rss_kb()
+    if measurement['seconds'] > 0:
+        measurement['states_per_second'] = (
+            measurement['states'] / measurement['seconds'])
+    else:
+        measurement['states_per_second'] = None
+    return measurement
+
+
+def get_peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+    return peak_rss
+
+
+def run_cases(cases):
+    # cases is [(name, case, args), ...], where each case is a module level
+    # function that returns a dict of at least seconds and states.
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for (name, case, args) in cases:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context) as executor:
+            measurement = executor.submit(_run_case, case, args).result()
+        measurement['name'] = name
+        print(format_measurement(measurement))
+        results.append(measurement)
+    return results
+
+
+def format_measurement(measurement):
+    line = '{}: {:.3f}s, {} states'.format(
+        measurement['name'],
+        measurement['seconds'],
+        measurement['states'])
+    if measurement['states_per_second'] is not None:
+        line += ' ({:.0f}/s)'.format(measurement['states_per_second'])
+    if 'edges' in measurement:
+        line += ', {} edges'.format(measurement['edges'])
+    return line + ', {} KiB peak RSS'.format(measurement['peak_rss_kb'])
+
+
+def write_results(path, puzzle, results):
+    document = {
+        'puzzle': puzzle,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results}
+    with open(path, 'w') as results_file:
+        json.dump(document, results_file, indent=2)
+        results_file.write('\n')
+
+
+def compare_results(path, results):
+    # Prints each case's wall time against the same case in an earlier
+    # run; a case that got slower shows a positive change.
+    with open(path) as results_file:
+        previous_results = {
+            measurement['name']: measurement
+            for measurement in json.load(results_file)['results']}
+    for measurement in results:
+        previous = previous_results.get(measurement['name'])
+        if previous is None or not previous['seconds']:
+            continue
+        print('{}: {:.3f}s against {:.3f}s ({:+.1%})'.format(
+            measurement['name'],
+            measurement['seconds'],
+            previous['seconds'],
+            measurement['seconds'] / previous['seconds'] - 1))
+
+
+def run(puzzle, cases, args):
+    results = run_cases(cases)
+    # Compared before writing, so that both can name the same file.
+    if args.compare is not None:
+        compare_results(args.compare, results)
+    if args.output is not None:
+        write_results(args.output, puzzle, results)
+    return results
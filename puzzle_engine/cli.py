@@ -0,0 +1,163 @@
+import json
+import logging
+import time
+
+from puzzle_engine import (
+    instrumentation,
+    state_graph,
+    traversal)
+
+# map builds (or loads) the full state graph, table the retrograde
+# distance table; the others search from the position alone.
+STRATEGIES = ('astar', 'ida_star', 'bidirectional', 'map', 'table')
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--strategy',
+        choices=STRATEGIES,
+        default='astar',
+        help='how to find the solution (default: %(default)s)')
+    parser.add_argument(
+        '--symmetric',
+        action='store_true',
+        help='fold symmetric positions together in map and table')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='processes that build the map in parallel')
+    parser.add_argument(
+        '--table-size',
+        type=int,
+        default=1 << 20,
+        help=(
+            'states each ida_star transposition table may hold; 0 keeps '
+            'only the current path (default: %(default)s)'))
+    parser.add_argument(
+        '--graph-directory',
+        default=state_graph.GRAPH_DIRECTORY,
+        help='where map saves and loads state graphs (default: %(default)s)')
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='neither load nor save the state graph')
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='print the solution as JSON')
+    parser.add_argument(
+        '--log-metrics',
+        action='store_true',
+        help='log counters and timings of each phase and BFS layer')
+    parser.add_argument(
+        '--metrics-file',
+        default=None,
+        help='write counters and timings to this file in the Prometheus '
+             'text format')
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='log a cProfile summary of each phase')
+    parser.add_argument(
+        '--trace-memory',
+        action='store_true',
+        help='log the memory each phase allocated, from tracemalloc')
+
+
+def get_instrumentation(args):
+    # None unless a metrics option was given.
+    sinks = []
+    if args.metrics_file is not None:
+        sinks.append(instrumentation.PrometheusFileSink(args.metrics_file))
+    if args.log_metrics or args.profile or args.trace_memory:
+        logging.basicConfig(level=logging.INFO)
+        sinks.append(instrumentation.LogSink())
+    if not sinks:
+        return None
+    return instrumentation.Instrumentation(
+        sinks,
+        profile=args.profile,
+        trace_memory=args.trace_memory)
+
+
+def solve(
+        puzzle_traversal,
+        strategy,
+        state_key,
+        workers=None,
+        table_size=0):
+    # Returns the winning moves from state_key, or None if there are none.
+    rules = puzzle_traversal.rules
+    if strategy == 'astar':
+        return puzzle_traversal.solve_astar(state_key)
+    if strategy == 'ida_star':
+        return puzzle_traversal.solve_ida_star(
+            state_key,
+            table_size=table_size)
+    if strategy == 'bidirectional':
+        return puzzle_traversal.solve_bidirectional(state_key)
+    if strategy == 'map':
+        puzzle_traversal.build_map(workers=workers)
+    elif strategy == 'table':
+        puzzle_traversal.map_distances_to_goal()
+    else:
+        raise ValueError('Unknown strategy {}'.format(strategy))
+    moves = [
+        move
+        for (_, move) in puzzle_traversal.get_shortest_winning_path(
+            state_key)]
+    if not moves and not rules.is_goal(state_key):
+        return None
+    return moves
+
+
+def get_move_fields(move):
+    return {
+        'piece_type': move.piece_type,
+        'piece_from': list(move.piece_from),
+        'piece_to': list(move.piece_to),
+        'direction': move.direction}
+
+
+def run(rules, args, state_key=None):
+    # Solves from state_key, or from the rules' start, and prints the
+    # result.  Returns the process exit status.
+    if state_key is None:
+        state_key = rules.get_start_key()
+    graph_directory = args.graph_directory
+    if args.no_cache:
+        graph_directory = None
+    puzzle_traversal = traversal.Traversal(
+        rules,
+        graph_directory=graph_directory,
+        instrumentation=get_instrumentation(args))
+    started = time.perf_counter()
+    moves = solve(
+        puzzle_traversal,
+        args.strategy,
+        state_key,
+        workers=args.workers,
+        table_size=args.table_size)
+    seconds = time.perf_counter() - started
+    if args.json:
+        print(json.dumps({
+            'puzzle': rules.name,
+            'strategy': args.strategy,
+            'state_key': state_key,
+            'solved': moves is not None,
+            'seconds': seconds,
+            'moves': [get_move_fields(move) for move in moves or []]}))
+    elif moves is None:
+        print('No solution')
+    else:
+        for (number, move) in enumerate(moves, 1):
+            print('{}. {} {} -> {}'.format(
+                number,
+                move.piece_type,
+                move.piece_from,
+                move.piece_to))
+        print('{} moves in {:.2f}s'.format(len(moves), seconds))
+    if moves is None:
+        return 1
+    return 0
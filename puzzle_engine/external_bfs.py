@@ -0,0 +1,145 @@
+import array
+import heapq
+import os
+
+import numpy
+
+# Breadth-first search whose frontiers and visited layers live on disk as
+# sorted runs of packed uint64 state keys, so that only one chunk of states
+# needs to be in memory at a time.  Layer d holds every state exactly d
+# moves from the nearest goal.
+LAYER_FILE = 'layer-{:04d}.bin'
+RUN_FILE = 'run-{:04d}.bin'
+STATE_DTYPE = numpy.dtype(numpy.uint64)
+BLOCK_SIZE = 1 << 16
+
+
+def get_layer_path(directory, depth):
+    return os.path.join(directory, LAYER_FILE.format(depth))
+
+
+def build_layers(
+        directory,
+        goal_keys,
+        find_child_keys,
+        chunk_size=1 << 20,
+        on_layer=None):
+    # find_child_keys(state_key) returns the keys one move away.  Moves must
+    # be reversible, so that searching out from the goals gives the
+    # distance to the nearest goal.  Returns the number of layers.
+    # on_layer(depth, states) is called with the size of each layer.
+    os.makedirs(directory, exist_ok=True)
+    remove_layers(directory)
+    goal_keys = numpy.unique(numpy.array(list(goal_keys), dtype=STATE_DTYPE))
+    _write_keys(get_layer_path(directory, 0), goal_keys)
+    count = len(goal_keys)
+    depth = 0
+    while True:
+        if on_layer is not None:
+            on_layer(depth, count)
+        run_paths = []
+        children = array.array('Q')
+        for state_key in _iterate_keys(get_layer_path(directory, depth)):
+            children.extend(find_child_keys(state_key))
+            if len(children) >= chunk_size:
+                run_paths.append(_write_run(directory, run_paths, children))
+                children = array.array('Q')
+        if children:
+            run_paths.append(_write_run(directory, run_paths, children))
+
+        # Every neighbor of layer d is in layer d - 1, d or d + 1, so
+        # those two layers are all a child has to be checked against.
+        seen_paths = [get_layer_path(directory, depth)]
+        if depth > 0:
+            seen_paths.append(get_layer_path(directory, depth - 1))
+        next_path = get_layer_path(directory, depth + 1)
+        count = _merge_runs(run_paths, seen_paths, next_path)
+        for run_path in run_paths:
+            os.remove(run_path)
+        if count == 0:
+            os.remove(next_path)
+            return depth + 1
+        depth += 1
+
+
+def remove_layers(directory):
+    for name in os.listdir(directory):
+        if name.startswith(('layer-', 'run-')) and name.endswith('.bin'):
+            os.remove(os.path.join(directory, name))
+
+
+def _write_keys(path, keys):
+    with open(path, 'wb') as layer_file:
+        layer_file.write(numpy.asarray(keys, dtype=STATE_DTYPE).tobytes())
+
+
+def _write_run(directory, run_paths, keys):
+    path = os.path.join(directory, RUN_FILE.format(len(run_paths)))
+    _write_keys(path, numpy.unique(numpy.asarray(memoryview(keys))))
+    return path
+
+
+def _read_keys(path):
+    if os.path.getsize(path) == 0:
+        return numpy.zeros(0, dtype=STATE_DTYPE)
+    return numpy.memmap(path, dtype=STATE_DTYPE, mode='r')
+
+
+def _iterate_keys(path):
+    keys = _read_keys(path)
+    for start in range(0, len(keys), BLOCK_SIZE):
+        yield from keys[start:start + BLOCK_SIZE].tolist()
+
+
+def _merge_runs(run_paths, seen_paths, output_path):
+    # Merges the sorted runs, dropping duplicates and anything in the
+    # sorted seen_paths, into output_path.  Returns the number of keys
+    # written.
+    merged = heapq.merge(*[_iterate_keys(path) for path in run_paths])
+    seen = heapq.merge(*[_iterate_keys(path) for path in seen_paths])
+    seen_key = next(seen, None)
+    previous_key = None
+    count = 0
+    block = array.array('Q')
+    with open(output_path, 'wb') as layer_file:
+        for state_key in merged:
+            if state_key == previous_key:
+                continue
+            previous_key = state_key
+            while seen_key is not None and seen_key < state_key:
+                seen_key = next(seen, None)
+            if seen_key == state_key:
+                continue
+            block.append(state_key)
+            if len(block) >= BLOCK_SIZE:
+                layer_file.write(block.tobytes())
+                count += len(block)
+                block = array.array('Q')
+        layer_file.write(block.tobytes())
+        count += len(block)
+    return count
+
+
+class LayeredDistances:
+    # Memory-maps the layers written by build_layers.
+    def __init__(self, directory):
+        self.layers = []
+        while os.path.exists(get_layer_path(directory, len(self.layers))):
+            self.layers.append(
+                _read_keys(get_layer_path(directory, len(self.layers))))
+
+    def __len__(self):
+        return sum(len(layer) for layer in self.layers)
+
+    def in_layer(self, state_key, depth):
+        if not 0 <= depth < len(self.layers):
+            return False
+        layer = self.layers[depth]
+        position = int(numpy.searchsorted(layer, numpy.uint64(state_key)))
+        return position < len(layer) and layer[position] == state_key
+
+    def get_distance(self, state_key):
+        for depth in range(len(self.layers)):
+            if self.in_layer(state_key, depth):
+                return depth
+        return None
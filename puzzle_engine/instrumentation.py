@@ -0,0 +1,317 @@
+import collections
+import contextlib
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+
+# Counters kept by Instrumentation, all running totals.
+COUNTERS = (
+    # States taken off a frontier and expanded.
+    'states_expanded',
+    # Moves generated out of expanded states.
+    'moves_generated',
+    # Children not seen before, added to a frontier.
+    'states_generated',
+    # Children that were already known.
+    'duplicates')
+
+
+class Instrumentation:
+    # Optional counters and timings for Traversal.  The hot loops report
+    # once per expanded state and once per BFS layer; each phase (a graph
+    # build, a distance map, a search) reports a summary when it ends, and
+    # Traversal reports a ready event once its map can answer queries.
+    # Reports go to every sink as event dicts.
+    def __init__(self, sinks=(), profile=False, trace_memory=False):
+        self.sinks = list(sinks)
+        # With profile set, each phase runs under cProfile; with
+        # trace_memory set, under tracemalloc.
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.counters = collections.Counter()
+        # How many expanded states had each number of moves.
+        self.moves_per_state = collections.Counter()
+        self.phase = None
+        self.layer_started = None
+        # The last profile of each phase, for callers that want more than
+        # the summary in the phase event.
+        self.profiles = {}
+
+    def emit(self, event):
+        for sink in self.sinks:
+            sink.emit(event)
+
+    def count_expansion(self, moves, new_states=None):
+        # new_states is None where the caller cannot tell new states from
+        # duplicates, as in the searches.
+        counters = self.counters
+        counters['states_expanded'] += 1
+        counters['moves_generated'] += moves
+        if new_states is not None:
+            counters['states_generated'] += new_states
+            counters['duplicates'] += moves - new_states
+        self.moves_per_state[moves] += 1
+
+    def finish_layer(self, depth, frontier):
+        # Called once every state at depth is known, before any of them is
+        # expanded; frontier is how many there are.  The time is how long
+        # finding them took, since the phase began or the last layer.
+        now = time.perf_counter()
+        self.emit({
+            'event': 'layer',
+            'phase': self.phase,
+            'depth': depth,
+            'frontier': frontier,
+            'seconds': now - self.layer_started})
+        self.layer_started = now
+
+    def forward_to(self, events):
+        # An Instrumentation for a worker process that puts its events on
+        # the events queue, for receive to pass on at this end.
+        return Instrumentation(
+            [QueueSink(events)],
+            profile=self.profile,
+            trace_memory=self.trace_memory)
+
+    def receive(self, event):
+        if event['event'] == 'phase':
+            self.counters.update(event['counters'])
+            event = dict(event, totals=dict(self.counters))
+        self.emit(event)
+
+    @contextlib.contextmanager
+    def measure(self, phase):
+        if self.phase is not None:
+            # Nested in another phase, which already accounts for it.
+            yield
+            return
+        self.phase = phase
+        counters = collections.Counter(self.counters)
+        profiler = None
+        if self.profile:
+            profiler = cProfile.Profile()
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            elif hasattr(tracemalloc, 'reset_peak'):
+                # Python 3.9 and later; before that the peak of a phase
+                # traced by someone else counts from when they started.
+                tracemalloc.reset_peak()
+            snapshot = tracemalloc.take_snapshot()
+        started = self.layer_started = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            seconds = time.perf_counter() - started
+            event = {
+                'event': 'phase',
+                'phase': phase,
+                'seconds': seconds,
+                'counters': dict(self.counters - counters),
+                'totals': dict(self.counters),
+                'moves_per_state': dict(self.moves_per_state)}
+            if profiler is not None:
+                self.profiles[phase] = profiler
+                event['profile'] = get_profile_summary(profiler)
+            if self.trace_memory:
+                event['memory'] = get_memory_summary(snapshot)
+                if started_tracing:
+                    tracemalloc.stop()
+            self.phase = None
+            self.emit(event)
+
+
+def get_profile_summary(profiler, limit=20):
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+def get_memory_summary(snapshot, limit=10):
+    current, peak = tracemalloc.get_traced_memory()
+    differences = tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')
+    return {
+        'current_bytes': current,
+        'peak_bytes': peak,
+        'top': [str(difference) for difference in differences[:limit]]}
+
+
+class LogSink:
+    def __init__(self, logger=None):
+        if logger is None:
+            logger = logging.getLogger('puzzle_engine')
+        self.logger = logger
+
+    def emit(self, event):
+        if event['event'] == 'ready':
+            self.logger.info(
+                'Map ready: %d states, %d winning',
+                event['states'],
+                event['winning'])
+            return
+        if event['event'] == 'layer':
+            self.logger.info(
+                '%s layer %d: %d states in %.3fs',
+                event['phase'],
+                event['depth'],
+                event['frontier'],
+                event['seconds'])
+            return
+        self.logger.info(
+            '%s: %.3fs, %s',
+            event['phase'],
+            event['seconds'],
+            ', '.join(
+                '{} {}'.format(name, event['counters'].get(name, 0))
+                for name in COUNTERS))
+        if 'profile' in event:
+            self.logger.info(
+                '%s profile:\n%s',
+                event['phase'],
+                event['profile'])
+        if 'memory' in event:
+            self.logger.info(
+                '%s memory: %d bytes peak\n%s',
+                event['phase'],
+                event['memory']['peak_bytes'],
+                '\n'.join(event['memory']['top']))
+
+
+class CallbackSink:
+    def __init__(self, callback):
+        self.callback = callback
+
+    def emit(self, event):
+        self.callback(event)
+
+
+class ProgressSink:
+    # Turns layer events into progress events for a UI or caller:
+    # {'event': 'progress', 'phase', 'depth', 'states', 'eta_seconds'},
+    # where states counts every state found so far in the phase.  The ETA
+    # is the time to expand the states found but not yet expanded, at the
+    # rate so far.  A BFS cannot know how many states it has yet to find,
+    # so this is a lower bound that firms up as the layers shrink; it is
+    # None until there is a rate.  Ready events are passed on as they are.
+    def __init__(self, callback):
+        self.callback = callback
+        self.states = 0
+        self.seconds = 0
+
+    def emit(self, event):
+        if event['event'] == 'ready':
+            self.callback(event)
+            return
+        if event['event'] != 'layer':
+            return
+        if event['depth'] == 0:
+            self.states = 0
+            self.seconds = 0
+        # Finding this layer meant expanding every state before it.
+        expanded = self.states
+        self.states += event['frontier']
+        self.seconds += event['seconds']
+        eta_seconds = None
+        if expanded and self.seconds > 0:
+            eta_seconds = event['frontier'] * self.seconds / expanded
+        self.callback({
+            'event': 'progress',
+            'phase': event['phase'],
+            'depth': event['depth'],
+            'states': self.states,
+            'eta_seconds': eta_seconds})
+
+
+class QueueSink:
+    def __init__(self, events):
+        self.events = events
+
+    def emit(self, event):
+        self.events.put(event)
+
+
+class PrometheusFileSink:
+    # Rewrites path in the Prometheus text format whenever a phase ends,
+    # for a textfile collector to pick up.  Labels go on every sample.
+    def __init__(self, path, labels=None):
+        self.path = path
+        self.labels = dict(labels or {})
+        self.phase_seconds = {}
+        self.layers = {}
+        self.totals = {}
+        self.moves_per_state = {}
+        self.map_states = None
+
+    def emit(self, event):
+        if event['event'] == 'ready':
+            self.map_states = event['states']
+            self.write()
+            return
+        if event['event'] == 'layer':
+            self.layers[event['phase']] = (event['depth'], event['frontier'])
+            return
+        self.phase_seconds[event['phase']] = event['seconds']
+        self.totals = event['totals']
+        self.moves_per_state = event['moves_per_state']
+        self.write()
+
+    def format_labels(self, **labels):
+        labels = dict(self.labels, **labels)
+        if not labels:
+            return ''
+        return '{{{}}}'.format(','.join(
+            '{}="{}"'.format(name, str(value).replace('"', '\\"'))
+            for (name, value) in sorted(labels.items())))
+
+    def write(self):
+        lines = []
+        for name in COUNTERS:
+            metric = 'puzzle_engine_{}_total'.format(name)
+            lines.append('# TYPE {} counter'.format(metric))
+            lines.append('{}{} {}'.format(
+                metric,
+                self.format_labels(),
+                self.totals.get(name, 0)))
+        lines.append('# TYPE puzzle_engine_states_by_moves gauge')
+        for (moves, states) in sorted(self.moves_per_state.items()):
+            lines.append('puzzle_engine_states_by_moves{} {}'.format(
+                self.format_labels(moves=moves),
+                states))
+        lines.append('# TYPE puzzle_engine_phase_seconds gauge')
+        for (phase, seconds) in sorted(self.phase_seconds.items()):
+            lines.append('puzzle_engine_phase_seconds{} {}'.format(
+                self.format_labels(phase=phase),
+                seconds))
+        # Each family's samples follow its own TYPE line, as the format
+        # requires.
+        lines.append('# TYPE puzzle_engine_phase_depth gauge')
+        for (phase, (depth, _)) in sorted(self.layers.items()):
+            lines.append('puzzle_engine_phase_depth{} {}'.format(
+                self.format_labels(phase=phase),
+                depth))
+        lines.append('# TYPE puzzle_engine_last_frontier gauge')
+        for (phase, (_, frontier)) in sorted(self.layers.items()):
+            lines.append('puzzle_engine_last_frontier{} {}'.format(
+                self.format_labels(phase=phase),
+                frontier))
+        if self.map_states is not None:
+            lines.append('# TYPE puzzle_engine_map_states gauge')
+            lines.append('puzzle_engine_map_states{} {}'.format(
+                self.format_labels(),
+                self.map_states))
+        # Written whole and renamed, so a collector never reads half a file.
+        temporary_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(temporary_path, 'w') as metrics_file:
+            metrics_file.write('\n'.join(lines) + '\n')
+        os.replace(temporary_path, self.path)
@@ -0,0 +1,81 @@
+class Rules:
+    # What a puzzle tells the engine about itself.  States are integer
+    # state keys; moves are the puzzle's own move objects, packed into
+    # integer move codes for the state graph.
+    # Names the puzzle's saved graph files.
+    name = None
+    # Part of the name of saved state graphs; bump it whenever a change to
+    # the move rules or the graph layout makes old graph files wrong.
+    version = 1
+    # Whether goal states are expanded when the state graph is built, and
+    # whether edges between two goal states are kept.
+    expand_goals = True
+    # With symmetric set, canonicalize folds symmetric states into one.
+    symmetric = False
+
+    def get_identity(self):
+        # Everything but the start and the rules version that shapes the
+        # state graph, such as the board dimensions.
+        raise NotImplementedError()
+
+    def encode(self, board):
+        raise NotImplementedError()
+
+    def get_start_key(self):
+        raise NotImplementedError()
+
+    def successors(self, state_key):
+        # Yields (child_key, move) for every move out of state_key.
+        raise NotImplementedError()
+
+    def expand(self, state_key):
+        # Returns [(child_key, move_code), ...] in successor order, with the
+        # child keys canonicalized.
+        return [
+            (self.canonicalize(child_key)[0], self.pack_move(move))
+            for (child_key, move) in self.successors(state_key)]
+
+    def is_goal(self, state_key):
+        raise NotImplementedError()
+
+    def get_goal_keys(self):
+        raise NotImplementedError()
+
+    def reverse_move(self, move):
+        raise NotImplementedError()
+
+    def apply_move(self, state_key, move):
+        raise NotImplementedError()
+
+    def pack_move(self, move):
+        raise NotImplementedError()
+
+    def unpack_move(self, move_code):
+        raise NotImplementedError()
+
+    def estimate_moves(self, state_key):
+        # A lower bound on the moves left; 0 turns A* into plain BFS.
+        return 0
+
+    def canonicalize(self, state_key):
+        # Returns (canonical_key, transform), where transform_move maps a
+        # move out of canonical_key onto the same move out of state_key.
+        return state_key, None
+
+    def transform_move(self, move, transform):
+        return move
+
+    def get_codec(self):
+        raise NotImplementedError()
+
+
+class StateCodec:
+    # Numbers the legal placements of a puzzle's pieces 0 to count - 1, so
+    # that a table over every placement is a flat array indexed by rank.
+    count = 0
+
+    def rank(self, state_key):
+        raise NotImplementedError()
+
+    def unrank(self, rank):
+        raise NotImplementedError()
@@ -0,0 +1,234 @@
+import heapq
+import itertools
+
+FOUND = object()
+
+
+def bidirectional_search(start_key, goal_keys, find_child_moves, reverse_move):
+    # Breadth-first from both ends, always growing the smaller frontier by
+    # one full layer.  find_child_moves(state_key) yields
+    # (child_state_key, move); moves must be reversible by reverse_move.
+    # Returns the forward moves from start_key to a goal, or None.
+    forward_parents = {start_key: None}
+    forward_depths = {start_key: 0}
+    backward_parents = {}
+    backward_depths = {}
+    for goal_key in goal_keys:
+        backward_parents[goal_key] = None
+        backward_depths[goal_key] = 0
+    if start_key in backward_parents:
+        return []
+
+    forward_frontier = [start_key]
+    backward_frontier = list(backward_parents)
+    while forward_frontier and backward_frontier:
+        forward = len(forward_frontier) <= len(backward_frontier)
+        if forward:
+            frontier = forward_frontier
+            parents, depths = forward_parents, forward_depths
+            other_depths = backward_depths
+        else:
+            frontier = backward_frontier
+            parents, depths = backward_parents, backward_depths
+            other_depths = forward_depths
+
+        next_frontier = []
+        best_meeting = None
+        best_length = None
+        for state_key in frontier:
+            depth = depths[state_key] + 1
+            for (child_key, move) in find_child_moves(state_key):
+                if child_key in depths:
+                    continue
+                if forward:
+                    parents[child_key] = (state_key, move)
+                else:
+                    # Stored as the forward move out of child_key.
+                    parents[child_key] = (state_key, reverse_move(move))
+                depths[child_key] = depth
+                next_frontier.append(child_key)
+                if child_key in other_depths:
+                    length = depth + other_depths[child_key]
+                    if best_length is None or length < best_length:
+                        best_meeting = child_key
+                        best_length = length
+
+        if best_meeting is not None:
+            return _join_paths(best_meeting, forward_parents, backward_parents)
+        if forward:
+            forward_frontier = next_frontier
+        else:
+            backward_frontier = next_frontier
+    return None
+
+
+def _join_paths(meeting_key, forward_parents, backward_parents):
+    moves = _follow_parents(meeting_key, forward_parents)
+    state_key = meeting_key
+    while backward_parents[state_key] is not None:
+        state_key, move = backward_parents[state_key]
+        moves.append(move)
+    return moves
+
+
+def astar_search(start_key, is_goal, find_child_moves, estimate_moves):
+    # estimate_moves(state_key) must never overestimate the number of moves
+    # left, so the first goal taken off the heap is on a shortest path.
+    counter = itertools.count()
+    parents = {start_key: None}
+    costs = {start_key: 0}
+    heap = [(estimate_moves(start_key), next(counter), start_key)]
+    while heap:
+        _, _, state_key = heapq.heappop(heap)
+        if is_goal(state_key):
+            return _follow_parents(state_key, parents)
+        cost = costs[state_key] + 1
+        for (child_key, move) in find_child_moves(state_key):
+            if child_key in costs and costs[child_key] <= cost:
+                continue
+            costs[child_key] = cost
+            parents[child_key] = (state_key, move)
+            heapq.heappush(
+                heap,
+                (cost + estimate_moves(child_key), next(counter), child_key))
+    return None
+
+
+def ida_star_search(
+        start_key,
+        is_goal,
+        find_child_moves,
+        estimate_moves,
+        reverse_move=None,
+        table_size=0):
+    # Iterative deepening on cost + estimate.  By default only the current
+    # path is kept, so memory grows with the solution length.  A table_size
+    # trades memory for speed with three transposition tables of at most
+    # that many states each: the fewest moves each state was reached in
+    # during this iteration, as reaching it again in as many moves or more
+    # cannot lead anywhere new; a lower bound on its moves left, raised
+    # from its children's as they are searched, which never overestimates
+    # and so keeps paths shortest; and its child moves, so later iterations
+    # do not generate them again.  With reverse_move given, the move
+    # straight back is never tried.
+    search = _IdaStarSearch(
+        is_goal,
+        find_child_moves,
+        estimate_moves,
+        reverse_move,
+        table_size)
+    return search.run(start_key)
+
+
+class _IdaStarSearch:
+    def __init__(
+            self,
+            is_goal,
+            find_child_moves,
+            estimate_moves,
+            reverse_move,
+            table_size):
+        self.is_goal = is_goal
+        self.find_child_moves = find_child_moves
+        self.estimate_moves = estimate_moves
+        self.reverse_move = reverse_move
+        self.table_size = table_size
+        self.path_keys = set()
+        self.moves = []
+        self.costs = {}
+        self.estimates = {}
+        self.child_moves = {}
+
+    def run(self, start_key):
+        self.path_keys.add(start_key)
+        bound = self.get_estimate(start_key)
+        while True:
+            self.costs.clear()
+            next_bound = self.search(start_key, None, bound)
+            if next_bound is FOUND:
+                return self.moves
+            if next_bound is None or self.is_exhausted():
+                return None
+            bound = next_bound
+
+    def is_exhausted(self):
+        # Every state with an estimate has had its children generated, and
+        # each expanded state's children all get an estimate, so nothing
+        # is left to find: no goal is reachable.  Without this the learned
+        # estimates of states that cannot win would rise forever.
+        return len(self.child_moves) == len(self.estimates) < self.table_size
+
+    def get_estimate(self, state_key):
+        estimate = self.estimates.get(state_key)
+        if estimate is None:
+            estimate = self.estimate_moves(state_key)
+            if len(self.estimates) < self.table_size:
+                self.estimates[state_key] = estimate
+        return estimate
+
+    def get_child_moves(self, state_key):
+        child_moves = self.child_moves.get(state_key)
+        if child_moves is None:
+            child_moves = list(self.find_child_moves(state_key))
+            if len(self.child_moves) < self.table_size:
+                self.child_moves[state_key] = child_moves
+        return child_moves
+
+    def search(self, state_key, back_move, bound):
+        # Returns FOUND with the path in self.moves, or the smallest
+        # cost + estimate past bound below state_key, or None when there
+        # is nothing new below it.
+        cost = len(self.moves)
+        estimate = self.get_estimate(state_key)
+        if cost + estimate > bound:
+            return cost + estimate
+        if self.is_goal(state_key):
+            return FOUND
+        costs = self.costs
+        best_cost = costs.get(state_key)
+        if best_cost is not None and best_cost <= cost:
+            return None
+        if best_cost is not None or len(costs) < self.table_size:
+            costs[state_key] = cost
+        path_keys = self.path_keys
+        moves = self.moves
+        child_moves = self.get_child_moves(state_key)
+        next_bound = None
+        for (child_key, move) in child_moves:
+            if move == back_move or child_key in path_keys:
+                continue
+            if self.reverse_move is None:
+                child_back_move = None
+            else:
+                child_back_move = self.reverse_move(move)
+            path_keys.add(child_key)
+            moves.append(move)
+            result = self.search(child_key, child_back_move, bound)
+            if result is FOUND:
+                return FOUND
+            path_keys.remove(child_key)
+            moves.pop()
+            if result is not None and (
+                    next_bound is None or result < next_bound):
+                next_bound = result
+        # Every way on goes through a child, so one more than the least
+        # child estimate is still a lower bound.
+        if child_moves:
+            learned = 1 + min(
+                self.get_estimate(child_key)
+                for (child_key, _) in child_moves)
+            # Learning stops once the table is full, so the estimates
+            # settle and the bound cannot rise forever.
+            if (learned > estimate and state_key in self.estimates and
+                    len(self.estimates) < self.table_size):
+                self.estimates[state_key] = learned
+        return next_bound
+
+
+def _follow_parents(state_key, parents):
+    moves = []
+    while parents[state_key] is not None:
+        state_key, move = parents[state_key]
+        moves.append(move)
+    moves.reverse()
+    return moves
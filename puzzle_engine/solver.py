@@ -0,0 +1,136 @@
+import concurrent.futures
+import functools
+import threading
+
+from puzzle_engine import search
+
+
+class SearchAbandoned(Exception):
+    pass
+
+
+class SolverService:
+    # Answers "how does this position win?" with futures.  The full map is
+    # built on one worker.  Until it is ready, each query also runs an A*
+    # search from the queried position on a second worker.  The search
+    # only explores the region around that position, so near the end of a
+    # game it answers long before the map is finished.  Whichever of the
+    # two finishes first answers the query.
+    def __init__(self, traversal, processes=False):
+        self.traversal = traversal
+        # With processes set, the map is built in a worker process instead
+        # of competing with the caller's threads for the GIL.
+        self.processes = processes
+        self.map_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1)
+        self.query_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1)
+        self.map_future = None
+        # Queries still waiting for an answer, cancelled on shutdown.
+        self.query_futures = set()
+        self.answer_lock = threading.Lock()
+
+    def start(self):
+        if self.map_future is None:
+            if self.processes:
+                build_map = self.traversal.build_map_in_process
+            else:
+                build_map = self.traversal.build_map
+            self.map_future = self.map_executor.submit(build_map)
+        return self.map_future
+
+    def is_ready(self):
+        return (
+            self.map_future is not None and
+            self.map_future.done() and
+            self.map_future.exception() is None)
+
+    def has_failed(self):
+        # True once building the map has raised; queries then only search.
+        return (
+            self.map_future is not None and
+            self.map_future.done() and
+            self.map_future.exception() is not None)
+
+    def request_moves(self, current_board):
+        # Returns a future of the list of moves that wins from
+        # current_board, or of None if there is no way to win from it.
+        # Cancelling the future stops its search at the next expansion.
+        state_key = self.traversal.rules.encode(current_board)
+        future = concurrent.futures.Future()
+        if self.is_ready():
+            future.set_result(self.find_mapped_moves(state_key))
+            return future
+        self.query_futures.add(future)
+        future.add_done_callback(self.query_futures.discard)
+        self.query_executor.submit(self.search_moves, state_key, future)
+        if self.map_future is not None:
+            self.map_future.add_done_callback(functools.partial(
+                self.answer_from_map,
+                state_key,
+                future))
+        return future
+
+    def get_moves(self, current_board, timeout=None):
+        # Blocks for at most timeout seconds, then raises
+        # concurrent.futures.TimeoutError.
+        return self.request_moves(current_board).result(timeout)
+
+    def find_mapped_moves(self, state_key):
+        if self.traversal.rules.is_goal(state_key):
+            return []
+        moves = [
+            move
+            for (_, move) in self.traversal.get_shortest_winning_path(
+                state_key)]
+        if not moves:
+            return None
+        return moves
+
+    def search_moves(self, state_key, future):
+        rules = self.traversal.rules
+
+        def find_child_moves(state_key):
+            # Gives up as soon as the map has answered instead, or the
+            # query has been cancelled.
+            if future.done():
+                raise SearchAbandoned()
+            return rules.successors(state_key)
+
+        try:
+            moves = search.astar_search(
+                state_key,
+                rules.is_goal,
+                find_child_moves,
+                rules.estimate_moves)
+        except SearchAbandoned:
+            return
+        except Exception as error:
+            self.answer(future, error=error)
+            return
+        self.answer(future, moves)
+
+    def answer_from_map(self, state_key, future, map_future):
+        if future.done() or map_future.exception() is not None:
+            return
+        self.answer(future, self.find_mapped_moves(state_key))
+
+    def answer(self, future, moves=None, error=None):
+        with self.answer_lock:
+            if future.done():
+                return
+            try:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(moves)
+            except concurrent.futures.InvalidStateError:
+                # Cancelled by the caller since the check.
+                pass
+
+    def shutdown(self):
+        # Queued searches then return as soon as they start.
+        for future in list(self.query_futures):
+            future.cancel()
+        self.query_executor.shutdown(wait=False)
+        self.map_executor.shutdown(wait=False)
@@ -0,0 +1,437 @@
+import array
+import mmap
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import queue
+
+import numpy
+
+NO_DISTANCE = -1
+NO_NODE = -1
+
+GRAPH_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'puzzle')
+GRAPH_FILE_MAGIC = b'PZGRAPH1'
+# Sections of a graph file, in file order, after the magic and a header of
+# node, edge and winning node counts.  Every section but the last is made
+# of 8-byte items, so each one starts 8-byte aligned.
+GRAPH_FILE_SECTIONS = (
+    ('state_keys', numpy.uint64, 'nodes'),
+    ('sorted_keys', numpy.uint64, 'nodes'),
+    ('sorted_nodes', numpy.int64, 'nodes'),
+    ('offsets', numpy.int64, 'offsets'),
+    ('neighbors', numpy.int64, 'edges'),
+    ('move_codes', numpy.int64, 'edges'),
+    ('winning_nodes', numpy.int64, 'winning_nodes'),
+    ('next_nodes', numpy.int64, 'nodes'),
+    ('goal_distances', numpy.int16, 'nodes'))
+PARTITION_MULTIPLIER = 0x9E3779B97F4A7C15
+GRAPH_FILE_HEADER = numpy.dtype([
+    ('magic', 'S8'),
+    ('nodes', '<i8'),
+    ('edges', '<i8'),
+    ('winning_nodes', '<i8')])
+
+
+class StateGraph:
+    # Compressed sparse row adjacency: the edges of node n are
+    # neighbors[offsets[n]:offsets[n + 1]], with the matching packed moves
+    # in move_codes.  Nodes are numbered in discovery order.
+    def __init__(self):
+        self.state_keys = array.array('Q')
+        self.offsets = array.array('l', [0])
+        self.neighbors = array.array('l')
+        self.move_codes = array.array('l')
+        self.index_by_key = {}
+        self.winning_nodes = array.array('l')
+        # Set instead of index_by_key on a graph loaded from a file, where
+        # state keys are looked up by binary search.
+        self.sorted_keys = None
+        self.sorted_nodes = None
+
+    def __len__(self):
+        return len(self.state_keys)
+
+    def add_node(self, state_key):
+        node = len(self.state_keys)
+        self.state_keys.append(state_key)
+        self.index_by_key[state_key] = node
+        return node
+
+    def add_edge(self, neighbor, move_code):
+        self.neighbors.append(neighbor)
+        self.move_codes.append(move_code)
+
+    def finish_node(self):
+        self.offsets.append(len(self.neighbors))
+
+    def get_node(self, state_key):
+        if self.index_by_key is not None:
+            return self.index_by_key.get(state_key)
+        position = int(numpy.searchsorted(
+            self.sorted_keys,
+            numpy.uint64(state_key)))
+        if (position < len(self.sorted_keys) and
+                self.sorted_keys[position] == state_key):
+            return int(self.sorted_nodes[position])
+        return None
+
+    def get_move_code(self, node, neighbor):
+        for (edge_neighbor, move_code) in self.get_edges(node):
+            if edge_neighbor == neighbor:
+                return move_code
+        return None
+
+    def get_edges(self, node):
+        start = self.offsets[node]
+        end = self.offsets[node + 1]
+        return zip(
+            self.neighbors[start:end].tolist(),
+            self.move_codes[start:end].tolist())
+
+    def map_distances(self, source_nodes):
+        distances, _ = self.map_next_hops(source_nodes)
+        return distances
+
+    def map_next_hops(self, source_nodes, on_layer=None):
+        # Level-synchronous BFS that expands a whole frontier per step with
+        # array operations.  Seeding every goal gives the distance to the
+        # nearest one, and next_nodes[n] is the neighbor of n one step
+        # closer to it (NO_NODE for the sources and unreached states).
+        # on_layer(depth, states) is called with the size of each layer.
+        offsets = numpy.asarray(memoryview(self.offsets))
+        neighbors = numpy.asarray(memoryview(self.neighbors))
+        distances = numpy.full(len(self), NO_DISTANCE, dtype=numpy.int16)
+        next_nodes = numpy.full(len(self), NO_NODE, dtype=numpy.int64)
+        frontier = numpy.unique(numpy.asarray(source_nodes, dtype=numpy.int64))
+        distances[frontier] = 0
+        depth = 0
+        while frontier.size:
+            if on_layer is not None:
+                on_layer(depth, int(frontier.size))
+            depth += 1
+            starts = offsets[frontier]
+            counts = offsets[frontier + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                break
+            # Flatten the edge ranges of every frontier node into one index
+            # array into neighbors.
+            ends = numpy.cumsum(counts)
+            edges = (
+                numpy.arange(total) +
+                numpy.repeat(starts - (ends - counts), counts))
+            candidates = neighbors[edges]
+            parents = numpy.repeat(frontier, counts)
+            unvisited = distances[candidates] == NO_DISTANCE
+            candidates, first_edges = numpy.unique(
+                candidates[unvisited],
+                return_index=True)
+            distances[candidates] = depth
+            next_nodes[candidates] = parents[unvisited][first_edges]
+            frontier = candidates
+        return distances, next_nodes
+
+
+def get_graph_chunks(graph, goal_distances, next_nodes):
+    # The bytes of a graph file, as a list of chunks in file order.
+    state_keys = numpy.asarray(memoryview(graph.state_keys))
+    sorted_nodes = numpy.argsort(state_keys, kind='stable')
+    sections = {
+        'state_keys': state_keys,
+        'sorted_keys': state_keys[sorted_nodes],
+        'sorted_nodes': sorted_nodes,
+        'offsets': numpy.asarray(memoryview(graph.offsets)),
+        'neighbors': numpy.asarray(memoryview(graph.neighbors)),
+        'move_codes': numpy.asarray(memoryview(graph.move_codes)),
+        'winning_nodes': numpy.asarray(memoryview(graph.winning_nodes)),
+        'next_nodes': next_nodes,
+        'goal_distances': goal_distances}
+    header = numpy.array(
+        [(GRAPH_FILE_MAGIC,
+          len(graph),
+          len(graph.neighbors),
+          len(graph.winning_nodes))],
+        dtype=GRAPH_FILE_HEADER)
+    chunks = [header.tobytes()]
+    for (name, dtype, _) in GRAPH_FILE_SECTIONS:
+        chunks.append(numpy.asarray(sections[name], dtype=dtype).tobytes())
+    return chunks
+
+
+def save_graph(path, graph, goal_distances, next_nodes):
+    # Writes to a temporary file first so that a reader never maps a
+    # half-written graph.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'wb') as graph_file:
+        for chunk in get_graph_chunks(graph, goal_distances, next_nodes):
+            graph_file.write(chunk)
+    os.replace(temporary_path, path)
+
+
+def load_graph(path):
+    # Returns (graph, goal_distances, next_nodes) backed by a read-only
+    # memory map of path, or None if there is no usable graph there.
+    try:
+        with open(path, 'rb') as graph_file:
+            buffer = mmap.mmap(
+                graph_file.fileno(),
+                0,
+                access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    return read_graph(buffer)
+
+
+def share_graph(graph, goal_distances, next_nodes):
+    # Copies the graph, in the graph file format, into a new block of
+    # shared memory and returns its name for attach_graph.  The block
+    # outlives this process until attach_graph unlinks it.
+    chunks = get_graph_chunks(graph, goal_distances, next_nodes)
+    memory = shared_memory.SharedMemory(
+        create=True,
+        size=sum(len(chunk) for chunk in chunks))
+    offset = 0
+    for chunk in chunks:
+        memory.buf[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    name = memory.name
+    memory.close()
+    return name
+
+
+def attach_graph(name):
+    # Takes in a graph shared by share_graph in another process with one
+    # copy out of the block, which is then freed.  Arrays over the block
+    # itself would keep it from ever being closed cleanly.
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        buffer = bytes(memory.buf)
+    finally:
+        memory.close()
+        memory.unlink()
+    return read_graph(buffer)
+
+
+def read_graph(buffer):
+    # Wraps the sections of a graph file held in buffer as arrays, without
+    # copying.
+    if len(buffer) < GRAPH_FILE_HEADER.itemsize:
+        return None
+    header = numpy.frombuffer(buffer, dtype=GRAPH_FILE_HEADER, count=1)[0]
+    if header['magic'] != GRAPH_FILE_MAGIC:
+        return None
+    counts = {
+        'nodes': int(header['nodes']),
+        'offsets': int(header['nodes']) + 1,
+        'edges': int(header['edges']),
+        'winning_nodes': int(header['winning_nodes'])}
+    sections = {}
+    offset = GRAPH_FILE_HEADER.itemsize
+    for (name, dtype, count_name) in GRAPH_FILE_SECTIONS:
+        count = counts[count_name]
+        end = offset + count * numpy.dtype(dtype).itemsize
+        if end > len(buffer):
+            return None
+        sections[name] = numpy.frombuffer(
+            buffer,
+            dtype=dtype,
+            count=count,
+            offset=offset)
+        offset = end
+
+    graph = StateGraph()
+    graph.state_keys = sections['state_keys']
+    graph.offsets = sections['offsets']
+    graph.neighbors = sections['neighbors']
+    graph.move_codes = sections['move_codes']
+    graph.winning_nodes = sections['winning_nodes']
+    graph.index_by_key = None
+    graph.sorted_keys = sections['sorted_keys']
+    graph.sorted_nodes = sections['sorted_nodes']
+    return graph, sections['goal_distances'], sections['next_nodes']
+
+
+def get_partition(state_key, partitions):
+    # State keys are digit encodings, so their low bits alone would spread
+    # states unevenly; mix all the bits in first.
+    mixed = (state_key * PARTITION_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF
+    return (mixed >> 32) % partitions
+
+
+def build_graph_in_parallel(
+        get_expander,
+        start_key,
+        workers,
+        expand_winning=True,
+        link_winning=True,
+        on_layer=None):
+    # Level-synchronous BFS across worker processes.  Every state belongs
+    # to the worker picked by get_partition, which deduplicates it and
+    # expands it.  Each level, workers send the children they generate to
+    # the children's owners, and the owners report the ones they have not
+    # seen before.  Numbering those by (parent, move) order gives every
+    # node the number the sequential build gives it.  Once all states are
+    # known, each worker resolves its own edges.
+    #
+    # get_expander() runs once in each worker and returns a function from a
+    # state key to (is_winning, [(child_key, move_code), ...]).  Without
+    # expand_winning, winning states do not add their children to the
+    # graph.  Without link_winning, edges between winning states are left
+    # out.  on_layer(depth, states) is called with the size of each level.
+    context = multiprocessing.get_context('spawn')
+    commands = [context.Queue() for index in range(workers)]
+    inboxes = [context.Queue() for index in range(workers)]
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_run_graph_worker,
+            args=(
+                index,
+                workers,
+                get_expander,
+                expand_winning,
+                commands[index],
+                inboxes,
+                results),
+            daemon=True)
+        for index in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        state_keys = [start_key]
+        winning_nodes = []
+        assignments = {get_partition(start_key, workers): ([start_key], [0])}
+        depth = 0
+        while assignments:
+            if on_layer is not None:
+                on_layer(
+                    depth,
+                    sum(len(keys) for (keys, _) in assignments.values()))
+            depth += 1
+            for index in range(workers):
+                commands[index].put(
+                    ('expand',) + assignments.get(index, ([], [])))
+            candidates = []
+            for index in range(workers):
+                found, winning_found = _get_result(results, processes)
+                candidates.extend(found)
+                winning_nodes.extend(winning_found)
+            candidates.sort()
+            assignments = {}
+            for (_, _, child_key) in candidates:
+                keys, nodes = assignments.setdefault(
+                    get_partition(child_key, workers),
+                    ([], []))
+                keys.append(child_key)
+                nodes.append(len(state_keys))
+                state_keys.append(child_key)
+
+        state_keys = numpy.array(state_keys, dtype=numpy.uint64)
+        sorted_nodes = numpy.argsort(state_keys, kind='stable')
+        sorted_keys = state_keys[sorted_nodes]
+        winning = None
+        if not link_winning:
+            winning = numpy.zeros(len(state_keys), dtype=bool)
+            winning[winning_nodes] = True
+        for command in commands:
+            command.put(('link', sorted_keys, sorted_nodes, winning))
+        edges = [_get_result(results, processes) for index in range(workers)]
+    finally:
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+    edge_nodes = numpy.concatenate([edge[0] for edge in edges])
+    # Stable, so each node keeps its edges in move order.
+    order = numpy.argsort(edge_nodes, kind='stable')
+    graph = StateGraph()
+    graph.state_keys = state_keys
+    graph.offsets = numpy.zeros(len(state_keys) + 1, dtype=numpy.int64)
+    numpy.cumsum(
+        numpy.bincount(edge_nodes, minlength=len(state_keys)),
+        out=graph.offsets[1:])
+    graph.neighbors = numpy.concatenate([edge[1] for edge in edges])[order]
+    graph.move_codes = numpy.concatenate([edge[2] for edge in edges])[order]
+    graph.winning_nodes = numpy.array(sorted(winning_nodes), dtype=numpy.int64)
+    graph.index_by_key = None
+    graph.sorted_keys = sorted_keys
+    graph.sorted_nodes = sorted_nodes
+    return graph
+
+
+def _get_result(results, processes):
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            for process in processes:
+                if process.exitcode:
+                    raise Exception('Graph worker exited with {}'.format(
+                        process.exitcode))
+
+
+def _run_graph_worker(
+        index,
+        workers,
+        get_expander,
+        expand_winning,
+        commands,
+        inboxes,
+        results):
+    expand_state = get_expander()
+    known = set()
+    edge_nodes = array.array('q')
+    edge_keys = array.array('Q')
+    edge_codes = array.array('q')
+    while True:
+        command = commands.get()
+        if command[0] == 'expand':
+            _, keys, nodes = command
+            known.update(keys)
+            outgoing = [[] for owner in range(workers)]
+            winning_nodes = []
+            for (state_key, node) in zip(keys, nodes):
+                is_winning, successors = expand_state(state_key)
+                if is_winning:
+                    winning_nodes.append(node)
+                enqueue = expand_winning or not is_winning
+                for edge_index in range(len(successors)):
+                    child_key, move_code = successors[edge_index]
+                    edge_nodes.append(node)
+                    edge_keys.append(child_key)
+                    edge_codes.append(move_code)
+                    if enqueue:
+                        outgoing[get_partition(child_key, workers)].append(
+                            (node, edge_index, child_key))
+            for owner in range(workers):
+                inboxes[owner].put(outgoing[owner])
+
+            # Every worker sends every owner one list per level.
+            first_seen = {}
+            for sender in range(workers):
+                for (node, edge_index, child_key) in inboxes[index].get():
+                    if child_key in known:
+                        continue
+                    seen = first_seen.get(child_key)
+                    if seen is None or (node, edge_index) < seen:
+                        first_seen[child_key] = (node, edge_index)
+            results.put((
+                [(node, edge_index, child_key)
+                 for (child_key, (node, edge_index)) in first_seen.items()],
+                winning_nodes))
+        elif command[0] == 'link':
+            _, sorted_keys, sorted_nodes, winning = command
+            nodes = numpy.asarray(memoryview(edge_nodes))
+            keys = numpy.asarray(memoryview(edge_keys))
+            codes = numpy.asarray(memoryview(edge_codes))
+            positions = numpy.searchsorted(sorted_keys, keys)
+            positions[positions == len(sorted_keys)] = 0
+            found = sorted_keys[positions] == keys
+            neighbors = sorted_nodes[positions]
+            if winning is not None:
+                found &= ~(winning[nodes] & winning[neighbors])
+            results.put((nodes[found], neighbors[found], codes[found]))
+            return
@@ -0,0 +1,24 @@
+import contextlib
+import io
+import json
+import unittest
+
+from bishops import solve
+
+
+class JsonOutputTest(unittest.TestCase):
+    def test_map_prints_only_json(self):
+        # Map progress goes to stderr, so stdout parses as it is.
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout),\
+                contextlib.redirect_stderr(io.StringIO()):
+            status = solve.main(
+                ['--strategy', 'map', '--no-cache', '--json'])
+        self.assertEqual(status, 0)
+        result = json.loads(stdout.getvalue())
+        self.assertTrue(result['solved'])
+        self.assertEqual(len(result['moves']), 36)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from puzzle_engine import instrumentation
+
+
+class PrometheusFileSinkTest(unittest.TestCase):
+    def test_families_are_contiguous(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.prom')
+            sink = instrumentation.PrometheusFileSink(
+                path,
+                labels={'puzzle': 'bishops'})
+            for (phase, depth, frontier) in (
+                    ('build_graph', 3, 7),
+                    ('map_next_hops', 5, 2)):
+                sink.emit({
+                    'event': 'layer',
+                    'phase': phase,
+                    'depth': depth,
+                    'frontier': frontier,
+                    'seconds': 0.1})
+                sink.emit({
+                    'event': 'phase',
+                    'phase': phase,
+                    'seconds': 1.0,
+                    'counters': {},
+                    'totals': {'states_expanded': 10},
+                    'moves_per_state': {2: 10}})
+            with open(path) as metrics_file:
+                lines = metrics_file.read().splitlines()
+        # Every sample sits in the block under its family's TYPE line, and
+        # no family is declared twice.
+        families = []
+        for line in lines:
+            if line.startswith('# TYPE '):
+                families.append(line.split()[2])
+            else:
+                self.assertEqual(line.split('{')[0], families[-1])
+        self.assertEqual(len(families), len(set(families)))
+        self.assertIn(
+            'puzzle_engine_last_frontier{phase="map_next_hops",'
+            'puzzle="bishops"} 2',
+            lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import time
+import unittest
+
+from bishops import rules as bishops_rules
+from piano import rules as piano_rules
+from puzzle_engine import search
+
+# Generous next to the few seconds each takes with the tables, but far
+# below what a plain IDA* needs for either puzzle.
+TIME_BUDGET_SECONDS = 60
+TABLE_SIZE = 1 << 20
+
+
+class IdaStarSearchTest(unittest.TestCase):
+    def check_solves_start(self, rules, expected_length):
+        start_key = rules.get_start_key()
+        started = time.perf_counter()
+        moves = search.ida_star_search(
+            start_key,
+            rules.is_goal,
+            rules.successors,
+            rules.estimate_moves,
+            rules.reverse_move,
+            table_size=TABLE_SIZE)
+        seconds = time.perf_counter() - started
+        self.assertLess(seconds, TIME_BUDGET_SECONDS)
+        self.assertEqual(len(moves), expected_length)
+        state_key = start_key
+        for move in moves:
+            self.assertIn(
+                (rules.apply_move(state_key, move), move),
+                list(rules.successors(state_key)))
+            state_key = rules.apply_move(state_key, move)
+        self.assertTrue(rules.is_goal(state_key))
+
+    def test_solves_bishops_start(self):
+        self.check_solves_start(bishops_rules.BishopsRules(4, 5), 36)
+
+    def test_solves_piano_start(self):
+        self.check_solves_start(piano_rules.PianoRules(), 85)
+
+    def test_gives_up_when_unsolvable(self):
+        # No bishop can reach the other side of a 3 by 4 board.
+        rules = bishops_rules.BishopsRules(3, 4)
+        for table_size in (0, TABLE_SIZE):
+            with self.subTest(table_size=table_size):
+                self.assertIsNone(search.ida_star_search(
+                    rules.get_start_key(),
+                    rules.is_goal,
+                    rules.successors,
+                    rules.estimate_moves,
+                    rules.reverse_move,
+                    table_size=table_size))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import threading
+import unittest
+
+from bishops import rules as bishops_rules
+from puzzle_engine import (
+    solver,
+    traversal)
+
+TIMEOUT_SECONDS = 30
+
+
+class GatedRules(bishops_rules.BishopsRules):
+    # Takes state keys for boards, and holds each expansion until released.
+    def __init__(self):
+        super().__init__(4, 5)
+        self.expanding = threading.Event()
+        self.release = threading.Event()
+        self.expansions = 0
+
+    def encode(self, board):
+        return board
+
+    def successors(self, state_key):
+        self.expansions += 1
+        self.expanding.set()
+        self.release.wait(TIMEOUT_SECONDS)
+        return super().successors(state_key)
+
+
+class SolverServiceTest(unittest.TestCase):
+    def test_cancelled_request_stops_its_search(self):
+        rules = GatedRules()
+        # Never started, so only the searches answer.
+        service = solver.SolverService(traversal.Traversal(rules, None))
+        self.addCleanup(service.shutdown)
+        future = service.request_moves(rules.get_start_key())
+        self.assertTrue(rules.expanding.wait(TIMEOUT_SECONDS))
+        self.assertTrue(future.cancel())
+        rules.release.set()
+        # The single query worker is free again once the search gives up.
+        service.query_executor.submit(lambda: None).result(TIMEOUT_SECONDS)
+        self.assertEqual(rules.expansions, 1)
+        moves = service.get_moves(rules.get_start_key(), TIMEOUT_SECONDS)
+        self.assertEqual(len(moves), 36)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import random
+import tempfile
+import unittest
+
+from bishops import rules as bishops_rules
+from piano import rules as piano_rules
+from puzzle_engine import traversal
+
+try:
+    from piano import board as piano_board
+except ImportError:
+    # The boards need OpenGL and game_common.
+    piano_board = None
+
+SAMPLE_COUNT = 12
+# Random moves between samples.
+SAMPLE_SPACING = 15
+
+
+def get_sample_keys(rules, seed=0):
+    # Positions along a random walk from the start, so every map holds
+    # them.
+    chooser = random.Random(seed)
+    state_key = rules.get_start_key()
+    sample_keys = [state_key]
+    while len(sample_keys) < SAMPLE_COUNT:
+        for _ in range(SAMPLE_SPACING):
+            state_key, _ = chooser.choice(list(rules.successors(state_key)))
+        sample_keys.append(state_key)
+    return sample_keys
+
+
+def get_path_lengths(puzzle_traversal, state_keys):
+    return [
+        len(list(puzzle_traversal.get_shortest_winning_path(state_key)))
+        for state_key in state_keys]
+
+
+class TraversalTests:
+    # Run for each puzzle by the test cases below, which provide
+    # make_rules(symmetric).
+    @classmethod
+    def setUpClass(cls):
+        cls.rules = cls.make_rules(symmetric=False)
+        cls.sample_keys = get_sample_keys(cls.rules)
+
+    def test_codec_round_trips(self):
+        codec = self.rules.get_codec()
+        for state_key in self.sample_keys:
+            self.assertEqual(codec.unrank(codec.rank(state_key)), state_key)
+        chooser = random.Random(1)
+        ranks = [0, codec.count - 1] + [
+            chooser.randrange(codec.count) for _ in range(200)]
+        for rank in ranks:
+            self.assertEqual(codec.rank(codec.unrank(rank)), rank)
+
+    def test_strategies_agree(self):
+        puzzle_traversal = traversal.Traversal(self.rules, None)
+        expected = [
+            len(puzzle_traversal.solve_bidirectional(state_key))
+            for state_key in self.sample_keys]
+
+        puzzle_traversal = traversal.Traversal(self.rules, None)
+        puzzle_traversal.build_map()
+        self.assertEqual(
+            get_path_lengths(puzzle_traversal, self.sample_keys),
+            expected)
+
+        puzzle_traversal = traversal.Traversal(self.rules, None)
+        puzzle_traversal.build_map(workers=2)
+        self.assertEqual(
+            get_path_lengths(puzzle_traversal, self.sample_keys),
+            expected)
+
+        with tempfile.TemporaryDirectory() as directory:
+            puzzle_traversal = traversal.Traversal(self.rules, None)
+            puzzle_traversal.build_layers(directory)
+            self.assertEqual(
+                get_path_lengths(puzzle_traversal, self.sample_keys),
+                expected)
+
+        puzzle_traversal = traversal.Traversal(self.rules, None)
+        puzzle_traversal.map_distances_to_goal()
+        self.assertEqual(
+            get_path_lengths(puzzle_traversal, self.sample_keys),
+            expected)
+
+    def test_paths_are_legal(self):
+        lengths = None
+        for symmetric in (False, True):
+            rules = self.make_rules(symmetric=symmetric)
+            puzzle_traversal = traversal.Traversal(rules, None)
+            puzzle_traversal.build_map()
+            for state_key in self.sample_keys:
+                with self.subTest(symmetric=symmetric, state_key=state_key):
+                    for (child_key, move) in (
+                            puzzle_traversal.get_shortest_winning_path(
+                                state_key)):
+                        self.assertIn(
+                            child_key,
+                            [key for (key, _) in rules.successors(state_key)])
+                        self.assertEqual(
+                            rules.apply_move(state_key, move),
+                            child_key)
+                        state_key = child_key
+                    self.assertTrue(rules.is_goal(state_key))
+            symmetric_lengths = get_path_lengths(
+                puzzle_traversal,
+                self.sample_keys)
+            if lengths is None:
+                lengths = symmetric_lengths
+            self.assertEqual(symmetric_lengths, lengths)
+
+
+class BishopsTraversalTest(TraversalTests, unittest.TestCase):
+    @classmethod
+    def make_rules(cls, symmetric):
+        return bishops_rules.BishopsRules(4, 5, symmetric=symmetric)
+
+
+class PianoTraversalTest(TraversalTests, unittest.TestCase):
+    @classmethod
+    def make_rules(cls, symmetric):
+        return piano_rules.PianoRules(symmetric=symmetric)
+
+    @unittest.skipIf(piano_board is None, 'needs OpenGL and game_common')
+    def test_blank_moves_match_moves(self):
+        board = piano_board.Board.from_initial_state()
+        for state_key in self.sample_keys:
+            board.update_pieces_from_positions(
+                piano_rules.decode_positions(state_key))
+            moves = set(
+                get_move_fields(move)
+                for piece_moves in board.find_moves().values()
+                for move in piece_moves)
+            blank_moves = [
+                get_move_fields(move)
+                for (_, move) in board.find_blank_moves()]
+            self.assertEqual(len(blank_moves), len(set(blank_moves)))
+            self.assertEqual(set(blank_moves), moves)
+            self.assertEqual(
+                set(
+                    get_move_fields(move)
+                    for move in piano_rules.find_state_moves(state_key)),
+                moves)
+
+
+def get_move_fields(move):
+    return (move.piece_type, move.piece_from, move.piece_to, move.direction)
+
+
+if __name__ == '__main__':
+    unittest.main()
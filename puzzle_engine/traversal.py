@@ -0,0 +1,535 @@
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import multiprocessing
+import os
+import queue
+import sys
+
+from puzzle_engine import (
+    external_bfs,
+    search,
+    state_graph)
+
+# Marks placements that no distance table entry has been found for.
+UNVISITED = 255
+
+
+def build_shared_map(rules, graph_directory, worker_instrumentation=None):
+    # Runs in the worker process of Traversal.build_map_in_process.
+    traversal = Traversal(
+        rules,
+        graph_directory=graph_directory,
+        instrumentation=worker_instrumentation)
+    traversal.build_map()
+    return state_graph.share_graph(
+        traversal.graph,
+        traversal.goal_distances,
+        traversal.next_nodes)
+
+
+def get_state_expander(rules):
+    # Runs in the worker processes of Traversal.build_graph_in_parallel.
+    return Traversal(rules, graph_directory=None).expand_state
+
+
+class Traversal:
+    # Solves any puzzle that implements rules.Rules, working on state keys
+    # only.  The rules object is pickled into worker processes, so it has
+    # to stay cheap to pickle.
+    def __init__(
+            self,
+            rules,
+            graph_directory=state_graph.GRAPH_DIRECTORY,
+            instrumentation=None):
+        self.rules = rules
+        # Where build_map keeps the finished map between runs; None turns
+        # saving and loading off.
+        self.graph_directory = graph_directory
+        # An instrumentation.Instrumentation, or None to measure nothing.
+        self.instrumentation = instrumentation
+        self.graph = None
+        self.winning_distances = []
+        self.goal_distances = None
+        self.next_nodes = None
+        # Set by build_layers, for when the state space is too big to map.
+        self.layer_distances = None
+        # Tables of a byte per codec rank, indexed by canonical state key.
+        self.distances_from_start = None
+        self.distances_to_goal = None
+
+    def measure(self, phase):
+        if self.instrumentation is None:
+            return contextlib.nullcontext()
+        return self.instrumentation.measure(phase)
+
+    def get_layer_callback(self):
+        if self.instrumentation is None:
+            return None
+        return self.instrumentation.finish_layer
+
+    def get_successors(self):
+        # rules.successors, counting expansions when instrumented.
+        successors = self.rules.successors
+        instruments = self.instrumentation
+        if instruments is None:
+            return successors
+
+        def count_successors(state_key):
+            children = list(successors(state_key))
+            instruments.count_expansion(len(children))
+            return children
+        return count_successors
+
+    def report_ready(self):
+        # Tells the instrumentation that the map can answer queries.
+        if self.instrumentation is None:
+            return
+        self.instrumentation.emit({
+            'event': 'ready',
+            'states': len(self.graph),
+            'winning': len(self.graph.winning_nodes)})
+
+    def get_shortest_winning_path(self, state_key):
+        # Yields (state_key, move) for each move of a shortest way to win.
+        if self.graph is None and self.layer_distances is not None:
+            yield from self.follow_layers(state_key)
+            return
+        rules = self.rules
+        canonical_key, transform = rules.canonicalize(state_key)
+        node = None
+        if self.graph is not None:
+            node = self.graph.get_node(canonical_key)
+        if node is None:
+            # Not in the mapped graph, which the full table still covers.
+            if self.distances_to_goal is not None:
+                yield from self.follow_distances_to_goal(state_key)
+            return
+        if self.next_nodes is not None:
+            next_hops = self.follow_next_hops(node)
+        else:
+            next_hops = self.follow_winning_distances(node)
+        for (node, move_code) in next_hops:
+            move = rules.transform_move(
+                rules.unpack_move(move_code),
+                transform)
+            state_key = rules.apply_move(state_key, move)
+            _, transform = rules.canonicalize(state_key)
+            yield (state_key, move)
+
+    def follow_winning_distances(self, node):
+        path_distances = None
+        for distances in self.winning_distances:
+            if distances[node] == state_graph.NO_DISTANCE:
+                continue
+            if (path_distances is None or
+                    distances[node] < path_distances[node]):
+                path_distances = distances
+        if path_distances is None:
+            return
+
+        moves = path_distances[node]
+        while moves > 0:
+            for (neighbor, move_code) in self.graph.get_edges(node):
+                if path_distances[neighbor] == moves - 1:
+                    node = neighbor
+                    yield (node, move_code)
+                    moves -= 1
+                    break
+
+    def follow_next_hops(self, node):
+        graph = self.graph
+        if self.goal_distances[node] == state_graph.NO_DISTANCE:
+            return
+        while self.goal_distances[node] > 0:
+            next_node = int(self.next_nodes[node])
+            move_code = graph.get_move_code(node, next_node)
+            node = next_node
+            yield (node, move_code)
+
+    def get_graph_path(self):
+        # Graph files are named after everything that shapes the graph, so
+        # that a changed layout or rule set never loads a stale one.
+        rules = self.rules
+        identity = repr(
+            (rules.version,) +
+            tuple(rules.get_identity()) +
+            (rules.get_start_key(), rules.symmetric))
+        return os.path.join(
+            self.graph_directory,
+            '{}-{}.graph'.format(
+                rules.name,
+                hashlib.sha256(identity.encode()).hexdigest()[:16]))
+
+    def get_layers_directory(self):
+        return '{}-layers'.format(os.path.splitext(self.get_graph_path())[0])
+
+    def load_map(self):
+        if self.graph_directory is None:
+            return False
+        loaded = state_graph.load_graph(self.get_graph_path())
+        if loaded is None:
+            return False
+        self.graph, self.goal_distances, self.next_nodes = loaded
+        print(
+            'Loaded state graph: {} states, {} winning'.format(
+                len(self.graph),
+                len(self.graph.winning_nodes)),
+            file=sys.stderr)
+        return True
+
+    def save_map(self):
+        if self.graph_directory is None:
+            return
+        try:
+            state_graph.save_graph(
+                self.get_graph_path(),
+                self.graph,
+                self.goal_distances,
+                self.next_nodes)
+        except OSError as error:
+            print(
+                'Could not save state graph: {}'.format(error),
+                file=sys.stderr)
+
+    def build_map_in_process(self):
+        # Builds in a worker process, so that the UI thread keeps the GIL,
+        # and maps the finished arrays back in from shared memory.
+        if self.load_map():
+            self.report_ready()
+            return
+        context = multiprocessing.get_context('spawn')
+        with contextlib.ExitStack() as stack:
+            executor = stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=context))
+            events = None
+            worker_instrumentation = None
+            if self.instrumentation is not None:
+                # The worker measures itself and sends its events back.
+                events = stack.enter_context(context.Manager()).Queue()
+                worker_instrumentation = self.instrumentation.forward_to(
+                    events)
+            future = executor.submit(
+                build_shared_map,
+                self.rules,
+                self.graph_directory,
+                worker_instrumentation)
+            if events is not None:
+                self.receive_events(events, future)
+            shared_name = future.result()
+        self.graph, self.goal_distances, self.next_nodes =\
+            state_graph.attach_graph(shared_name)
+        print(
+            'Attached state graph: {} states, {} winning'.format(
+                len(self.graph),
+                len(self.graph.winning_nodes)),
+            file=sys.stderr)
+        self.report_ready()
+
+    def receive_events(self, events, future):
+        # Passes events from a worker on until the worker is done.  The
+        # worker's map is not ready here until it has been attached, so its
+        # ready event is left for this end to report.
+        while True:
+            try:
+                event = events.get(timeout=0.1)
+            except queue.Empty:
+                if future.done():
+                    return
+                continue
+            if event['event'] != 'ready':
+                self.instrumentation.receive(event)
+
+    def build_layers(self, directory=None, chunk_size=1 << 20):
+        # Disk-backed alternative to build_map for state spaces that do not
+        # fit in memory: distance-to-goal layers written by
+        # external_bfs.build_layers and memory-mapped back in.
+        if directory is None:
+            directory = self.get_layers_directory()
+        goal_keys = [
+            self.rules.canonicalize(goal_key)[0]
+            for goal_key in self.rules.get_goal_keys()]
+        print(
+            'Building distance layers in {}'.format(directory),
+            file=sys.stderr)
+        with self.measure('build_layers'):
+            external_bfs.build_layers(
+                directory,
+                goal_keys,
+                self.find_child_keys,
+                chunk_size=chunk_size,
+                on_layer=self.get_layer_callback())
+        self.layer_distances = external_bfs.LayeredDistances(directory)
+        print(
+            'Distance layers built: {} states, {} layers'.format(
+                len(self.layer_distances),
+                len(self.layer_distances.layers)),
+            file=sys.stderr)
+
+    def find_child_keys(self, state_key):
+        return [child_key for (child_key, _) in self.rules.expand(state_key)]
+
+    def follow_layers(self, state_key):
+        rules = self.rules
+        distance = self.layer_distances.get_distance(
+            rules.canonicalize(state_key)[0])
+        if distance is None:
+            return
+        while distance > 0:
+            for (child_key, move) in rules.successors(state_key):
+                if self.layer_distances.in_layer(
+                        rules.canonicalize(child_key)[0],
+                        distance - 1):
+                    state_key = child_key
+                    distance -= 1
+                    yield (state_key, move)
+                    break
+
+    def build_map(self, nearest_goal=True, workers=None):
+        # With workers set, the graph is built by that many processes.
+        if nearest_goal and self.load_map():
+            self.report_ready()
+            return
+        print('Building state graph', file=sys.stderr)
+        if workers:
+            graph = self.build_graph_in_parallel(workers)
+        else:
+            graph = self.build_graph()
+        print(
+            'State graph built: {} states, {} winning'.format(
+                len(graph),
+                len(graph.winning_nodes)),
+            file=sys.stderr)
+        if nearest_goal:
+            # One BFS seeded with every winning state instead of one per
+            # winning state.
+            print('Mapping nearest winning states', file=sys.stderr)
+            with self.measure('map_next_hops'):
+                self.goal_distances, self.next_nodes = graph.map_next_hops(
+                    graph.winning_nodes,
+                    on_layer=self.get_layer_callback())
+            print('Finished nearest winning map', file=sys.stderr)
+            self.save_map()
+            self.report_ready()
+            return
+        winning_distances = []
+        for path_index in range(len(graph.winning_nodes)):
+            print('Mapping path {}'.format(path_index), file=sys.stderr)
+            with self.measure('map_distances'):
+                winning_distances.append(
+                    graph.map_distances(
+                        [graph.winning_nodes[path_index]]))
+            print(
+                'Finished map for path {}'.format(path_index),
+                file=sys.stderr)
+        self.winning_distances = winning_distances
+        self.report_ready()
+
+    def build_graph(self):
+        if not self.rules.expand_goals:
+            return self.build_graph_around_goals()
+        with self.measure('build_graph'):
+            instruments = self.instrumentation
+            graph = state_graph.StateGraph()
+            starting_key, _ = self.rules.canonicalize(
+                self.rules.get_start_key())
+            graph.add_node(starting_key)
+            node = 0
+            # Nodes are numbered in BFS order, so a layer ends where the
+            # graph ended when the layer before it was finished.
+            depth = 0
+            layer_end = 0
+            while node < len(graph):
+                if instruments is not None and node == layer_end:
+                    instruments.finish_layer(depth, len(graph) - node)
+                    depth += 1
+                    layer_end = len(graph)
+                is_winning, successors = self.expand_state(
+                    graph.state_keys[node])
+                if is_winning:
+                    graph.winning_nodes.append(node)
+                states = len(graph)
+                for (child_key, move_code) in successors:
+                    child = graph.get_node(child_key)
+                    if child is None:
+                        child = graph.add_node(child_key)
+                    graph.add_edge(child, move_code)
+                graph.finish_node()
+                if instruments is not None:
+                    instruments.count_expansion(
+                        len(successors),
+                        len(graph) - states)
+                node += 1
+        self.graph = graph
+        return graph
+
+    def build_graph_around_goals(self):
+        # Goal states are not expanded, so a first pass finds the states
+        # and a second pass emits each state's edges within that set.
+        with self.measure('build_graph'):
+            instruments = self.instrumentation
+            graph = state_graph.StateGraph()
+            starting_key, _ = self.rules.canonicalize(
+                self.rules.get_start_key())
+            graph.add_node(starting_key)
+            winning_nodes = set()
+            node = 0
+            depth = 0
+            layer_end = 0
+            while node < len(graph):
+                if instruments is not None and node == layer_end:
+                    instruments.finish_layer(depth, len(graph) - node)
+                    depth += 1
+                    layer_end = len(graph)
+                state_key = graph.state_keys[node]
+                if self.rules.is_goal(state_key):
+                    winning_nodes.add(node)
+                else:
+                    states = len(graph)
+                    children = self.rules.expand(state_key)
+                    for (child_key, _) in children:
+                        if graph.get_node(child_key) is None:
+                            graph.add_node(child_key)
+                    if instruments is not None:
+                        instruments.count_expansion(
+                            len(children),
+                            len(graph) - states)
+                node += 1
+
+            for node in range(len(graph)):
+                for (child_key, move_code) in self.rules.expand(
+                        graph.state_keys[node]):
+                    child = graph.get_node(child_key)
+                    if child is None:
+                        continue
+                    if node in winning_nodes and child in winning_nodes:
+                        continue
+                    graph.add_edge(child, move_code)
+                graph.finish_node()
+            graph.winning_nodes.extend(sorted(winning_nodes))
+        self.graph = graph
+        return graph
+
+    def build_graph_in_parallel(self, workers):
+        # Expansions happen in the workers, so only layers are measured.
+        starting_key, _ = self.rules.canonicalize(self.rules.get_start_key())
+        with self.measure('build_graph_in_parallel'):
+            self.graph = state_graph.build_graph_in_parallel(
+                functools.partial(get_state_expander, self.rules),
+                starting_key,
+                workers,
+                expand_winning=self.rules.expand_goals,
+                link_winning=self.rules.expand_goals,
+                on_layer=self.get_layer_callback())
+        return self.graph
+
+    def expand_state(self, state_key):
+        # Returns (is_winning, [(child_key, move_code), ...]) with the
+        # child keys canonicalized, in move order.
+        return self.rules.is_goal(state_key), self.rules.expand(state_key)
+
+    def solve_bidirectional(self, state_key):
+        with self.measure('solve_bidirectional'):
+            return search.bidirectional_search(
+                state_key,
+                self.rules.get_goal_keys(),
+                self.get_successors(),
+                self.rules.reverse_move)
+
+    def solve_astar(self, state_key):
+        with self.measure('solve_astar'):
+            return search.astar_search(
+                state_key,
+                self.rules.is_goal,
+                self.get_successors(),
+                self.rules.estimate_moves)
+
+    def solve_ida_star(self, state_key, table_size=0):
+        with self.measure('solve_ida_star'):
+            return search.ida_star_search(
+                state_key,
+                self.rules.is_goal,
+                self.get_successors(),
+                self.rules.estimate_moves,
+                self.rules.reverse_move,
+                table_size=table_size)
+
+    def map_distances_from_start(self):
+        # Graph-free discovery: one byte per ranked placement instead of a
+        # graph node per reachable state.
+        with self.measure('map_distances_from_start'):
+            self.distances_from_start = self.map_distances(
+                [self.rules.get_start_key()])
+        return self.distances_from_start
+
+    def map_distances_to_goal(self):
+        # Retrograde analysis: filled backwards from every goal placement.
+        # Moves are reversible, so the reversed moves are just the moves.
+        # Unlike the map, this covers positions that cannot be reached from
+        # the start; any placement left UNVISITED is illegal or cannot be
+        # won.
+        with self.measure('map_distances_to_goal'):
+            self.distances_to_goal = self.map_distances(
+                self.rules.get_goal_keys())
+        return self.distances_to_goal
+
+    def map_distances(self, seed_keys):
+        # Breadth-first over canonical keys from seed_keys, a byte per
+        # codec rank.
+        rules = self.rules
+        codec = rules.get_codec()
+        instruments = self.instrumentation
+        distances = bytearray([UNVISITED]) * codec.count
+        frontier = []
+        for seed_key in seed_keys:
+            seed_key, _ = rules.canonicalize(seed_key)
+            seed_rank = codec.rank(seed_key)
+            if distances[seed_rank] == UNVISITED:
+                distances[seed_rank] = 0
+                frontier.append(seed_key)
+        depth = 0
+        while frontier:
+            if instruments is not None:
+                instruments.finish_layer(depth, len(frontier))
+            depth += 1
+            if depth >= UNVISITED:
+                raise Exception('Distance {} does not fit the table'.format(
+                    depth))
+            next_frontier = []
+            for state_key in frontier:
+                states = len(next_frontier)
+                children = rules.expand(state_key)
+                for (child_key, _) in children:
+                    child_rank = codec.rank(child_key)
+                    if distances[child_rank] == UNVISITED:
+                        distances[child_rank] = depth
+                        next_frontier.append(child_key)
+                if instruments is not None:
+                    instruments.count_expansion(
+                        len(children),
+                        len(next_frontier) - states)
+            frontier = next_frontier
+        return distances
+
+    def get_distance_to_goal(self, state_key):
+        canonical_key, _ = self.rules.canonicalize(state_key)
+        distance = self.distances_to_goal[
+            self.rules.get_codec().rank(canonical_key)]
+        if distance == UNVISITED:
+            return None
+        return distance
+
+    def follow_distances_to_goal(self, state_key):
+        distance = self.get_distance_to_goal(state_key)
+        if distance is None:
+            return
+        while distance > 0:
+            for (child_key, move) in self.rules.successors(state_key):
+                if self.get_distance_to_goal(child_key) == distance - 1:
+                    state_key = child_key
+                    distance -= 1
+                    yield (state_key, move)
+                    break